@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 
 # Classes
@@ -90,11 +91,75 @@ def testParallel(v1: tuple, v2: tuple, tolerance: float = 0.0001):
             return 1
     return 0
 
+# Batched versions of the above, for testing many vectors at once. Each row of an array argument is one
+# vector, and vector arguments are broadcast against the rows. The arithmetic is done in the same order as the
+# tuple versions, so the results are the same for every row.
+
+def dotBatch(v1s, v2s):
+    return v1s[..., 0] * v2s[..., 0] + v1s[..., 1] * v2s[..., 1] + v1s[..., 2] * v2s[..., 2]
+def cross3Batch(v1s, v2s):
+    return np.stack((
+        v1s[..., 1] * v2s[..., 2] - v1s[..., 2] * v2s[..., 1],
+        v1s[..., 2] * v2s[..., 0] - v1s[..., 0] * v2s[..., 2],
+        v1s[..., 0] * v2s[..., 1] - v1s[..., 1] * v2s[..., 0]
+    ), axis = -1)
+
+def magnitudeSquaredBatch(vs):
+    return dotBatch(vs, vs)
+def magnitudeBatch(vs):
+    return np.sqrt(magnitudeSquaredBatch(vs))
+
+# Same results as testParallel, but zero vectors aren't reported
+def testParallelBatch(v1s, v2s, tolerance: float = 0.0001):
+    m1, m2 = magnitudeBatch(v1s), magnitudeBatch(v2s)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        parallel = (m1 != 0) & (m2 != 0) & (1 - np.abs(dotBatch(v1s * (1 / m1)[..., None], v2s * (1 / m2)[..., None])) <= tolerance)
+    result = np.zeros(parallel.shape, np.int8)
+    result[parallel] = 1
+    result[parallel & np.all(v1s * v2s > -tolerance, axis = -1)] = 2
+    return result
+
+# Which of the points lie strictly between a and b?
+def pointsOnSegmentBatch(points, a, b, tolerance: float = 0.0001):
+    return testParallelBatch(points - a, points - b, tolerance) == 1
+
+# Which of the segments (starts[i], ends[i]) cross the segment (a, b), and where? None of the segments should share
+# an end with (a, b). Returns a mask and the intersection points (rows that don't cross hold garbage).
+def segmentsCrossBatch(starts, ends, a, b, tolerance: float = 0.0001):
+    # Cancel if linearly dependent
+    c1 = cross3Batch(a - starts, ends - a)
+    c2 = cross3Batch(b - ends, starts - b)
+    crosses = (magnitudeSquaredBatch(c1) >= tolerance) & (magnitudeSquaredBatch(c2) >= tolerance)
+
+    # Cancel if the 4 points are not coplanar
+    crosses &= testParallelBatch(c1, c2, tolerance) == 2
+
+    # Calculate the intersection, falling back to another pair of axes when a denominator is too small
+    ar, br, d = ends - starts, b - a, starts - a
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        denominators = [ar[:, i] * br[(i + 1) % 3] - br[i] * ar[:, (i + 1) % 3] for i in range(3)]
+        s = np.where(np.abs(denominators[0]) > tolerance, (d[:, 1] * br[0] - d[:, 0] * br[1]) / denominators[0],
+            np.where(np.abs(denominators[1]) > tolerance, (d[:, 2] * br[1] - d[:, 1] * br[2]) / denominators[1],
+            (d[:, 0] * br[2] - d[:, 2] * br[0]) / denominators[2]))
+        intersections = starts + ar * s[:, None]
+
+        # Cancel if the intersection doesn't lie on both segments
+        crosses &= testParallelBatch(intersections - starts, intersections - ends, tolerance) == 1
+        crosses &= testParallelBatch(intersections - a, intersections - b, tolerance) == 1
+    return crosses, intersections
+
+
 # More specific functions
 
 def pointToLineDist(p: tuple, l: Line):
     return math.sqrt(magnitude(subV(p, l.point)) ** 2 - scalarProj(subV(p, l.point), l.direction) ** 2)
 
+def pointToSegmentDistance(p: tuple, a: tuple, b: tuple):
+    ab, ds = subV(b, a), distanceSquared(a, b)
+    if ds == 0: return distance(p, a)
+    t = max(0, min(1, dot(subV(p, a), ab) / ds))
+    return distance(p, addV(a, scaleV(ab, t)))
+
 def midpoint(p1: tuple, p2: tuple):
     return scaleV(addV(p1, p2), 0.5)
 
@@ -126,6 +191,48 @@ def lerpAngle(a: float, a_dest: float, factor: float):
         return a + (a_dest - a) * factor
     return a - (a - a_dest) * factor
 
+# Quaternions, as (w, x, y, z) tuples. Multiplying q1 by q2 gives the rotation q2 followed by q1.
+
+def quatFromAxisAngle(axis: tuple, theta: float):
+    return (math.cos(theta / 2),) + scaleV(normalize(axis), math.sin(theta / 2))
+
+def quatMultiply(q1: tuple, q2: tuple):
+    w1, x1, y1, z1 = q1
+    w2, x2, y2, z2 = q2
+    return (
+        w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+        w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+        w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+        w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2
+    )
+
+# The matrix that rotates column vectors by q
+def quatToMatrix(q: tuple):
+    w, x, y, z = q
+    return np.array((
+        (1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)),
+        (2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)),
+        (2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y))
+    ))
+
+# The shortest rotation that turns the direction of v1 into the direction of v2
+def quatBetweenVectors(v1: tuple, v2: tuple):
+    v1, v2 = normalize(v1), normalize(v2)
+    d = dot(v1, v2)
+    if d < -1 + 1e-9:
+        # Opposite directions: turn halfway around any perpendicular axis
+        axis = cross3(v1, (1, 0, 0)) if abs(v1[0]) < 0.9 else cross3(v1, (0, 1, 0))
+        return quatFromAxisAngle(axis, math.pi)
+    return normalize((1 + d,) + cross3(v1, v2))
+
+def quatSlerp(q1: tuple, q2: tuple, factor: float):
+    d = dot(q1, q2)
+    # q and -q are the same rotation, so take the short way around
+    if d < 0: q2, d = scaleV(q2, -1), -d
+    if d > 0.9995: return normalize(lerpV(q1, q2, factor))
+    theta = math.acos(d)
+    return addV(scaleV(q1, math.sin((1 - factor) * theta) / math.sin(theta)), scaleV(q2, math.sin(factor * theta) / math.sin(theta)))
+
 # Other
 
 def lerpFloat(f: float, f_dest: float, factor: float):
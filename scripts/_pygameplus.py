@@ -4,8 +4,6 @@ from pygame import gfxdraw
 from _resource import *
 from _linalg import *
 
-pygame.mixer.init()
-
 # Loading resources
 
 def loadImage(path: str):
@@ -14,8 +12,29 @@ def loadImage(path: str):
 def loadFont(path: str, size: int):
     return pygame.font.Font(resourcePath("fonts/" + path), size)
 
-def loadSfx(path: str):
-    return pygame.mixer.Sound(resourcePath("sounds/sfx/" + path))
+# Sound effects are decoded when they're first played, unless the prefetcher gets to them first. Opening the audio
+# device can be slow, so the mixer isn't started until startAudio, and sounds played before then are skipped.
+sfxCache = ResourceCache(lambda path: pygame.mixer.Sound(resourcePath("sounds/sfx/" + path)))
+sfxToPrefetch = [] # String Array (Sounds to prefetch once the mixer is started)
+
+class Sfx:
+    def __init__(self, path: str):
+        self.path = path
+
+    def play(self, *args):
+        if not pygame.mixer.get_init(): return None
+        return sfxCache.get(self.path).play(*args)
+
+def loadSfx(path: str, prefetch: bool = True):
+    if prefetch:
+        if pygame.mixer.get_init(): sfxCache.prefetch([path])
+        else: sfxToPrefetch.append(path)
+    return Sfx(path)
+
+def startAudio():
+    pygame.mixer.init()
+    sfxCache.prefetch(sfxToPrefetch)
+    sfxToPrefetch.clear()
 
 def loadMusic(path: str):
     pygame.mixer.music.load(resourcePath("sounds/music/" + path))
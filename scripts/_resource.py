@@ -1,29 +1,100 @@
-import os
+import os, time, threading, collections, concurrent.futures
 
 def resourcePath(path):
     return os.path.join(os.path.dirname(__file__), "..", "resources", path)
 
-def loadFile(path):
+# The file's whole contents, or None if it can't be opened. The file is closed before returning.
+def readFile(path, mode = 'r'):
     try:
-        f = open(resourcePath(path))
-        return f
-    except:
+        with open(resourcePath(path), mode) as f:
+            return f.read()
+    except OSError:
         return None
 
 def loadFileLines(path):
-    f = loadFile(path)
-    if f:
-        return list(f.read().splitlines())
+    text = readFile(path)
+    if text is not None:
+        return list(text.splitlines())
     return None
 
 def loadFileGrid(path):
-    f = loadFile(path)
-    if f:
-        return [[*s] for s in f.read().splitlines()]
+    text = readFile(path)
+    if text is not None:
+        return [[*s] for s in text.splitlines()]
     return None
 
-def newFile(path):
-    return open(resourcePath(path), 'a')
+def newFile(path, mode = 'w'):
+    return open(resourcePath(path), mode)
+
+# Writes to a temporary file next to the destination and then renames it over the destination, so the file is
+# never left half written (e.g. if the game quits in the middle)
+def replaceFile(path, data, mode):
+    temporaryPath = path + ".tmp"
+    with newFile(temporaryPath, mode) as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(resourcePath(temporaryPath), resourcePath(path))
 
 def writeTextFile(path, text):
-    newFile(path).write(text)
\ No newline at end of file
+    replaceFile(path, text, 'w')
+
+def writeBinaryFile(path, data):
+    replaceFile(path, data, 'wb')
+
+
+# Resource cache
+
+# Holds up to `capacity` loaded resources, keyed by path, dropping the least recently used when it's full.
+# Resources are loaded by calling load(path) the first time they're asked for, or ahead of time on a background
+# thread with prefetch. How long each load took is kept in timings.
+
+class ResourceCache:
+    def __init__(self, load, capacity: int = 32):
+        self.load = load
+        self.capacity = capacity
+        self.items = collections.OrderedDict() # String -> Resource (Least recently used first)
+        self.loading = {} # String -> Future (Resources being prefetched)
+        self.timings = {} # String -> Float (Seconds the last load of each path took)
+        self.lock = threading.Lock()
+        self.prefetcher = None # Started on the first prefetch
+
+    def get(self, path: str):
+        with self.lock:
+            if path in self.items:
+                self.items.move_to_end(path)
+                return self.items[path]
+            future = self.loading.get(path)
+        if future is not None: return future.result()
+        return self.add(path)
+
+    def add(self, path: str):
+        t = time.perf_counter()
+        item = self.load(path)
+        with self.lock:
+            self.timings[path] = time.perf_counter() - t
+            self.items[path] = item
+            self.items.move_to_end(path)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last = False)
+            self.loading.pop(path, None)
+        return item
+
+    def prefetch(self, paths):
+        with self.lock:
+            if self.prefetcher is None: self.prefetcher = concurrent.futures.ThreadPoolExecutor(1)
+            for path in paths:
+                if path not in self.items and path not in self.loading:
+                    self.loading[path] = self.prefetcher.submit(self.add, path)
+
+    # Total seconds spent loading, and how many loads that was
+    def loadTime(self):
+        with self.lock:
+            return sum(self.timings.values()), len(self.timings)
+
+    # Waits for any prefetching to finish and drops everything
+    def close(self):
+        if self.prefetcher is not None: self.prefetcher.shutdown()
+        with self.lock:
+            self.items.clear()
+            self.loading.clear()
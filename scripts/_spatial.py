@@ -0,0 +1,125 @@
+import math, itertools
+from _linalg import *
+
+
+# Uniform grid
+
+# Items are stored in every cell that their bounding box overlaps, so a query only has to look at the items
+# that share a cell with the query box instead of every item. Items can be any hashable object.
+
+class UniformGrid:
+    def __init__(self, cellSize: float, dimensions: int = 3):
+        self.cellSize = cellSize
+        self.dimensions = dimensions
+        self.cells = {} # Int Tuple -> Set (Which items overlap each cell?)
+        self.itemCells = {} # Item -> Int Tuple List (Which cells does each item overlap?)
+
+    def __len__(self):
+        return len(self.itemCells)
+
+    def __contains__(self, item):
+        return item in self.itemCells
+
+    def cellRange(self, lower: tuple, upper: tuple):
+        return itertools.product(*(range(math.floor(lower[i] / self.cellSize), math.floor(upper[i] / self.cellSize) + 1) for i in range(self.dimensions)))
+
+    def insert(self, item, lower: tuple, upper: tuple):
+        if item in self.itemCells: self.remove(item)
+        cells = list(self.cellRange(lower, upper))
+        for cell in cells:
+            if cell in self.cells: self.cells[cell].add(item)
+            else: self.cells[cell] = {item}
+        self.itemCells[item] = cells
+
+    def remove(self, item):
+        for cell in self.itemCells.pop(item, ()):
+            items = self.cells[cell]
+            items.discard(item)
+            if not items: del self.cells[cell]
+
+    # Returns every item whose box shares a cell with the query box (a superset of the overlapping items)
+    def query(self, lower: tuple, upper: tuple):
+        found = set()
+        for cell in self.cellRange(lower, upper):
+            if cell in self.cells: found |= self.cells[cell]
+        return found
+
+    # Item cell lists are never modified after insertion, so only the cell sets need copying
+    def copy(self):
+        grid = UniformGrid(self.cellSize, self.dimensions)
+        grid.cells = {cell: set(items) for cell, items in self.cells.items()}
+        grid.itemCells = dict(self.itemCells)
+        return grid
+
+    def clear(self):
+        self.cells.clear()
+        self.itemCells.clear()
+
+
+# Bounding boxes
+
+def pointsBounds(points, padding: float = 0):
+    lower = tuple([min(p[i] for p in points) - padding for i in range(len(points[0]))])
+    upper = tuple([max(p[i] for p in points) + padding for i in range(len(points[0]))])
+    return lower, upper
+
+
+# Screen-space picking
+
+# Buckets projected vertices into square cells, so finding the vertex nearest to the mouse only looks at the few
+# cells around it. Edges are stored in every cell along their length, and only once an edge query needs them.
+# Points are indexed by vertex id, and edges maps edge ids to their (vertex id, vertex id) pairs.
+
+class ScreenIndex:
+    def __init__(self, points, vertexIds, edges, cellSize: float):
+        self.points = points
+        self.edges = edges
+        self.cellSize = cellSize
+
+        self.vertexCells = {} # Int Tuple -> Int Array (Which vertices are in each cell?)
+        for v in vertexIds:
+            cell = self.cellOf(points[v])
+            if cell in self.vertexCells: self.vertexCells[cell].append(v)
+            else: self.vertexCells[cell] = [v]
+        self.edgeCells = None # Int Tuple -> Int Array (Which edges pass through each cell?)
+
+    def cellOf(self, p: tuple):
+        return (math.floor(p[0] / self.cellSize), math.floor(p[1] / self.cellSize))
+
+    def cellsAround(self, p: tuple, r: float):
+        (left, top), (right, bottom) = self.cellOf((p[0] - r, p[1] - r)), self.cellOf((p[0] + r, p[1] + r))
+        return itertools.product(range(left, right + 1), range(top, bottom + 1))
+
+    # Samples every half cell along each edge, which always lands in the cells it crosses, or in a neighbour of
+    # a corner it only clips (queries reach a whole cell past their radius, so those are still found).
+    def buildEdgeCells(self):
+        self.edgeCells = {}
+        for e, (v1, v2) in self.edges.items():
+            p1, p2 = self.points[v1], self.points[v2]
+            samples = math.ceil(2 * math.sqrt(distanceSquared(p1, p2)) / self.cellSize) + 1
+            for cell in {self.cellOf(lerpV(p1, p2, i / max(samples - 1, 1))) for i in range(samples)}:
+                if cell in self.edgeCells: self.edgeCells[cell].append(e)
+                else: self.edgeCells[cell] = [e]
+
+    # Returns the vertex closest to p that is less than maxDistance away and passes accept, or -1. Ties go to
+    # the lowest id.
+    def nearestVertex(self, p: tuple, maxDistance: float, accept = None):
+        best, bestDS = -1, maxDistance ** 2
+        for cell in self.cellsAround(p, maxDistance):
+            for v in self.vertexCells.get(cell, ()):
+                ds = distanceSquared(self.points[v], p)
+                if (ds < bestDS or (ds == bestDS and best != -1 and v < best)) and (accept is None or accept(v)):
+                    best, bestDS = v, ds
+        return best
+
+    # Returns the edge closest to p that is less than maxDistance away and passes accept, or -1
+    def nearestEdge(self, p: tuple, maxDistance: float, accept = None):
+        if self.edgeCells is None: self.buildEdgeCells()
+        edges = {e for cell in self.cellsAround(p, maxDistance + self.cellSize) for e in self.edgeCells.get(cell, ())}
+        best, bestD = -1, maxDistance
+        for e in sorted(edges):
+            v1, v2 = self.edges[e]
+            d = pointToSegmentDistance(p, self.points[v1], self.points[v2])
+            if d < bestD and (accept is None or accept(e)):
+                best, bestD = e, d
+        return best
@@ -0,0 +1,23 @@
+# How the wireframe is shown, shared by the window (pygameapp, shaders) and softwarerenderer. Kept free of pygame
+# and moderngl so softwarerenderer runs without them.
+
+# Projection (see App.worldToScreen). Zooms are fractions of the screen size.
+WORLD_EYE_Z = -10
+WORLD_SCREEN_Z = -5
+ZOOM_PERSPECTIVE = 0.8
+ZOOM_ORTHOGONAL = 0.4
+
+# The look of the wireframe, set once
+SHADER_PARAMETERS = {
+    'gradientTop': (0, 0, 0.25),
+    'gradientBot': (0.16, 0, 0.2),
+
+    'edgeBrightness': 2,
+    'glowBrightness': 0.3,
+    'edgeRadius': 0.00,
+    'edgeAntiAlias': 0.004,
+    'glowRadius': 0.03,
+    'depthFactor': 4,
+    'edgeWhitening': 0.075,
+    'vertexHighlightRadius': 0.015
+}
@@ -0,0 +1,62 @@
+import random, sys, time, io, contextlib
+from wireframe import *
+
+# Compares the batched cross checks used by Wireframe.addEdge against the one-at-a-time checks, on a dense
+# wireframe made by adding random edges to a preset.
+#
+# Usage: python benchmark.py [edge count] [preset] [seed]
+
+def denseWireframe(numEdges, preset, seed):
+    rng = random.Random(seed)
+    w = wireframeFromPreset(preset)
+    while w.numEdges < numEdges:
+        vs = w.liveVertices().tolist()
+        w.addEdge(rng.choice(vs), rng.choice(vs), Wireframe.defaultStyle)
+    return w
+
+# The one-at-a-time edge check divides by zero on some degenerate pairs, which counts as not crossing here
+def scalarEdgeCheck(w, e, v1, v2):
+    try:
+        return w.edgeEdgeCrossCheck(w.edgeLinks(e), {v1, v2})
+    except ZeroDivisionError:
+        return None
+
+def scalarCrossings(w, v1, v2):
+    vertex = next((v for v in w.liveVertices().tolist() if w.vertexEdgeCrossCheck(v, {v1, v2})), -1)
+    edge = next((e for e in w.liveEdges().tolist() if scalarEdgeCheck(w, e, v1, v2)), -1)
+    return vertex, edge
+
+def batchedCrossings(w, v1, v2):
+    bounds = w.edgeBounds(v1, v2)
+    return w.crossingVertex(v1, v2, bounds), w.crossingEdge(v1, v2, bounds)[0]
+
+def timeEach(function, w, pairs):
+    t = time.perf_counter()
+    results = [function(w, v1, v2) for v1, v2 in pairs]
+    return results, (time.perf_counter() - t) / len(pairs)
+
+if __name__ == '__main__':
+    numEdges = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    preset = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    t = time.perf_counter()
+    w = denseWireframe(numEdges, preset, seed)
+    print("Built a wireframe with {} vertices and {} edges in {:.2f} s".format(w.numVertices, w.numEdges, time.perf_counter() - t))
+
+    rng = random.Random(seed)
+    vs = w.liveVertices().tolist()
+    pairs = [(v1, v2) for v1, v2 in (rng.sample(vs, 2) for i in range(200)) if w.findEdge(v1, v2) == -1]
+
+    with contextlib.redirect_stdout(io.StringIO()): # testParallel prints every zero vector it finds
+        scalar, scalarTime = timeEach(scalarCrossings, w, pairs)
+    batched, batchedTime = timeEach(batchedCrossings, w, pairs)
+    mismatches = sum(s != b for s, b in zip(scalar, batched))
+
+    print("Cross checks per new edge: scalar {:.3f} ms, batched {:.3f} ms ({:.1f}x)".format(scalarTime * 1000, batchedTime * 1000, scalarTime / batchedTime))
+    print("{} of {} results differ".format(mismatches, len(pairs)))
+
+    t = time.perf_counter()
+    for v1, v2 in pairs[:50]:
+        w.copy().addEdge(v1, v2, Wireframe.defaultStyle)
+    print("addEdge (including a copy of the wireframe): {:.3f} ms".format((time.perf_counter() - t) / len(pairs[:50]) * 1000))
@@ -0,0 +1,88 @@
+import os, json, hashlib
+from wireframe import *
+from _resource import *
+
+# An index of the levels in a folder of resources/wireframes, so they can be listed, stepped through and searched
+# without decoding any of them. It's kept in the folder as index.json, and each entry records a level's file (its
+# .wire file if it has one, like loadWireframe), the file's size and modification time, and what's in the goal.
+# Refreshing only decodes the levels whose files changed since the index was written.
+
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+
+PRESET_NAMES = ("tetrahedron", "cube", "octahedron", "dodecahedron")
+
+class LevelCatalog:
+
+    def __init__(self, folder: str = "custom"):
+        self.folder = folder
+        self.levels = {} # String -> Dict (Each level's index entry, by name, in name order)
+        self.refresh()
+
+    def path(self, fileName: str):
+        return resourcePath("wireframes/" + self.folder + "/" + fileName)
+
+    def refresh(self):
+        try:
+            with open(self.path(INDEX_FILE)) as f:
+                index = json.load(f)
+            indexed = index["levels"] if index.get("version") == INDEX_VERSION else {}
+        except (OSError, ValueError, KeyError):
+            indexed = {}
+
+        files = {} # String -> String (Which file each level is loaded from)
+        for fileName in os.listdir(self.path("")):
+            name, extension = os.path.splitext(fileName)
+            if extension == ".wire" or (extension == ".txt" and name not in files):
+                files[name] = fileName
+
+        levels = {}
+        for name in sorted(files):
+            stat = os.stat(self.path(files[name]))
+            entry = indexed.get(name)
+            if entry is None or (entry["file"], entry["size"], entry["mtime"]) != (files[name], stat.st_size, stat.st_mtime_ns):
+                entry = {"file": files[name], "size": stat.st_size, "mtime": stat.st_mtime_ns, **self.describe(name)}
+            levels[name] = entry
+        self.levels = levels
+
+        if levels != indexed:
+            with open(self.path(INDEX_FILE), "w") as f:
+                json.dump({"version": INDEX_VERSION, "levels": levels}, f, indent = 1)
+
+    # The metadata of a level's goal, or the error it can't be loaded because of
+    def describe(self, name: str):
+        try:
+            goal = self.load(name)
+        except Exception as e:
+            return {"error": type(e).__name__}
+        return {"preset": goal.preset, "vertices": goal.numVertices, "edges": goal.numEdges, "signature": goalHash(goal)}
+
+    def load(self, name: str):
+        return loadWireframe(self.folder + "/" + name)
+
+    # The levels that can be loaded, in name order
+    def names(self):
+        return [name for name, entry in self.levels.items() if "error" not in entry]
+
+    # The level step places after name (before it, if step is negative), wrapping around at the ends. Starts from
+    # the first level if name isn't one.
+    def step(self, name: str, step: int = 1):
+        names = self.names()
+        if not names: return None
+        if name not in names: return names[0]
+        return names[(names.index(name) + step) % len(names)]
+
+    # The levels with every word of the query in their name or their preset's name
+    def search(self, query: str):
+        words = query.lower().split()
+        return [name for name in self.names() if all(word in name.lower() or word in presetName(self.levels[name]["preset"]) for word in words)]
+
+def presetName(preset: int):
+    return PRESET_NAMES[preset] if 0 <= preset < len(PRESET_NAMES) else ""
+
+# A hash of a goal's shape, preset, vertex positions (at Wireframe.tolerance) and edges that doesn't depend on the
+# order of its vertices and edges, so levels with the same goal get the same one
+def goalHash(goal):
+    keys = {v: GoalSignature.positionKey(goal.position(v)) for v in goal.liveVertices().tolist()}
+    edges = sorted(tuple(sorted((keys[v1], keys[v2]))) for v1, v2 in goal.edgeVertices[goal.liveEdges()].tolist())
+    return hashlib.sha1(repr((goal.preset, sorted(keys.values()), edges)).encode()).hexdigest()
@@ -0,0 +1,31 @@
+import sys, os
+from wireframe import *
+from _resource import *
+
+# Converts the jsonpickle text levels in a folder of resources/wireframes to binary .wire files (see
+# wireframeToBytes), which loadWireframe reads instead when they exist. Each converted level is read back and
+# checked against the text one before it's written.
+#
+# Usage: python convertlevels.py [folder]
+# The folder defaults to custom.
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else "custom"
+    for fileName in sorted(os.listdir(resourcePath("wireframes/" + folder))):
+        name, extension = os.path.splitext(fileName)
+        if extension != ".txt": continue
+        try:
+            wireframe = wireframeFromText(readFile("wireframes/" + folder + "/" + fileName))
+        except Exception as e:
+            print("Skipped {} ({})".format(fileName, type(e).__name__))
+            continue
+
+        data = wireframeToBytes(wireframe)
+        converted = wireframeFromBytes(data)
+        styles = lambda w: [w.edgeStyle(e) for e in w.liveEdges().tolist()]
+        if not (wireframeEquality(converted, wireframe) and converted.preset == wireframe.preset and styles(converted) == styles(wireframe)):
+            print("Skipped {} (doesn't read back the same)".format(fileName))
+            continue
+
+        writeBinaryFile("wireframes/" + folder + "/" + name + ".wire", data)
+        print("Converted {} ({} bytes to {})".format(fileName, os.path.getsize(resourcePath("wireframes/" + folder + "/" + fileName)), len(data)))
@@ -0,0 +1,77 @@
+from wireframe import *
+
+# Undo/redo for a wireframe, stored as the ops each edit made rather than as whole wireframes, so memory grows
+# with the number of edits instead of the size of the wireframe.
+#
+# An edit is either an op list recorded by Wireframe.startJournal, or a Replacement when the whole wireframe is
+# swapped out (e.g. resetting the level). Every step is also appended to the log, which replay uses to rebuild
+# the session from its starting wireframe (see replaycheck.py).
+
+class Replacement:
+    def __init__(self, before, after):
+        self.before, self.after = before, after
+
+class History:
+
+    def __init__(self):
+        self.done = [] # Edit Array (Edits that can be undone, oldest first)
+        self.undone = [] # Edit Array (Edits that can be redone, most recently undone last)
+        self.log = [] # (String, Edit) Array (Every "do", "undo" and "redo" in the session)
+
+    def canUndo(self):
+        return len(self.done) > 0
+
+    def canRedo(self):
+        return len(self.undone) > 0
+
+    # Calls function on a copy of the wireframe and returns the copy and the ops it made, to push. Only reads the
+    # wireframe it is given, so it can run on another thread while that wireframe is on screen.
+    @staticmethod
+    def perform(wireframe, function, *args):
+        w = wireframe.copy()
+        w.startJournal()
+        function(w, *args)
+        return w, w.stopJournal()
+
+    def replace(self, wireframe, newWireframe):
+        self.push(Replacement(wireframe, newWireframe))
+        return newWireframe
+
+    def push(self, edit):
+        self.done.append(edit)
+        self.undone.clear()
+        self.log.append(("do", edit))
+
+    # Both return the wireframe with the edit reverted/applied again
+    def undo(self, wireframe):
+        edit = self.done.pop()
+        self.undone.append(edit)
+        self.log.append(("undo", edit))
+        return History.revert(wireframe, edit)
+
+    def redo(self, wireframe):
+        edit = self.undone.pop()
+        self.done.append(edit)
+        self.log.append(("redo", edit))
+        return History.apply(wireframe, edit)
+
+    @staticmethod
+    def apply(wireframe, edit):
+        if isinstance(edit, Replacement): return edit.after
+        w = wireframe.copy()
+        w.redo(edit)
+        return w
+
+    @staticmethod
+    def revert(wireframe, edit):
+        if isinstance(edit, Replacement): return edit.before
+        w = wireframe.copy()
+        w.undo(edit)
+        return w
+
+    # Rebuilds the session's current wireframe by applying every logged step to its starting wireframe
+    def replay(self, start):
+        w = start
+        for step, edit in self.log:
+            w = History.revert(w, edit) if step == "undo" else History.apply(w, edit)
+        return w
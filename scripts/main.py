@@ -1,4 +1,12 @@
+from profiler import startupTrace # Before anything else, so the imports are timed
+import sys
 import pygameapp
+startupTrace.mark("imports")
+
+# Usage: python main.py [--startup-check]
+# With --startup-check, the game quits as soon as it has started, printing how long each part of starting took,
+# and exits with an error if the first frame took longer than pygameapp.STARTUP_BUDGET to appear.
 
 if __name__ == '__main__':
-    app = pygameapp.App()
\ No newline at end of file
+    pygameapp.STARTUP_CHECK = "--startup-check" in sys.argv
+    app = pygameapp.App()
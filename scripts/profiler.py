@@ -0,0 +1,101 @@
+import time, json, csv, collections, contextlib
+
+# Times the stages of each frame. Stages run one after another, and lap ends the current one: the time since the
+# previous lap (or beginFrame) goes to the named stage. Work nested inside a stage can also be timed separately
+# with scope, which doesn't take it out of the stage around it.
+#
+# The last `window` recorded frames are kept for percentiles. When tracing, every recorded frame is also kept for
+# the whole session, to be written out with dump.
+
+class Profiler:
+
+    def __init__(self, window: int = 300, trace: bool = False):
+        self.samples = collections.OrderedDict() # String -> Float Deque (Recent times of each stage, in seconds)
+        self.window = window
+        self.trace = [] if trace else None # Dict Array (Every recorded frame's times)
+        self.frame = {} # String -> Float (This frame's times so far)
+        self.frameStart = self.lapStart = time.perf_counter()
+        self.frameCount = 0
+
+    def beginFrame(self):
+        self.frame = {}
+        self.frameStart = self.lapStart = time.perf_counter()
+
+    def lap(self, name: str):
+        t = time.perf_counter()
+        self.frame[name] = self.frame.get(name, 0) + t - self.lapStart
+        self.lapStart = t
+
+    @contextlib.contextmanager
+    def scope(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t)
+
+    # Adds time spent elsewhere (e.g. on another thread) to this frame
+    def record(self, name: str, seconds: float):
+        self.frame[name] = self.frame.get(name, 0) + seconds
+
+    # Frames that are begun but never ended (e.g. ones that didn't draw anything) are left out
+    def endFrame(self):
+        self.frame["total"] = time.perf_counter() - self.frameStart
+        self.frameCount += 1
+        for name, seconds in self.frame.items():
+            if name not in self.samples: self.samples[name] = collections.deque(maxlen=self.window)
+            self.samples[name].append(seconds)
+        if self.trace is not None:
+            self.trace.append({"frame": self.frameCount, **self.frame})
+
+    # The pth percentile (0 to 100) of a stage's recent times (from the frames it ran in), or 0 if it has none
+    def percentile(self, name: str, p: float):
+        samples = sorted(self.samples.get(name, ()))
+        if not samples: return 0
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    # One line per stage: its 50th, 95th and 99th percentile times in milliseconds
+    def summary(self):
+        return ["{}: {:.2f} / {:.2f} / {:.2f} ms".format(name, *(self.percentile(name, p) * 1000 for p in (50, 95, 99))) for name in self.samples]
+
+    # Writes the trace as CSV (one row per frame, one column per stage) or JSON, depending on the extension
+    def dump(self, path: str):
+        if self.trace is None: return
+        if path.endswith(".json"):
+            with open(path, "w") as f:
+                json.dump(self.trace, f)
+        else:
+            columns = list(dict.fromkeys(name for frame in self.trace for name in frame))
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, columns, restval=0)
+                writer.writeheader()
+                writer.writerows(self.trace)
+
+
+# Startup
+
+# Times the phases of starting the game, from when this module is first imported (main.py imports it before
+# anything else). Like Profiler.lap, mark ends the current phase.
+
+class StartupTrace:
+
+    def __init__(self):
+        self.start = self.lapStart = time.perf_counter()
+        self.phases = collections.OrderedDict() # String -> Float (Seconds each phase took)
+        self.firstFrame = None # Seconds from the start until the first frame was on screen
+
+    def mark(self, name: str):
+        t = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0) + t - self.lapStart
+        self.lapStart = t
+
+    def markFirstFrame(self):
+        self.mark("first frame")
+        self.firstFrame = self.lapStart - self.start
+
+    def report(self):
+        lines = ["{}: {:.1f} ms".format(name, seconds * 1000) for name, seconds in self.phases.items()]
+        if self.firstFrame is not None: lines.append("Time to first frame: {:.1f} ms".format(self.firstFrame * 1000))
+        return lines
+
+startupTrace = StartupTrace()
@@ -1,12 +1,17 @@
 from os import environ
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
 
-import pygame, sys, time, copy, jsonpickle
+import pygame, sys, time, copy, math, collections, concurrent.futures
+import numpy as np
 from pygame.locals import *
 from _resource import *
 from _linalg import *
 from _pygameplus import *
 from wireframe import *
+from history import *
+from profiler import *
+from catalog import *
+from _view import *
 import shaders
 
 # FEATURES FOR 0.8
@@ -32,24 +37,59 @@ import shaders
 
 WINDOW_SIZE = (700, 700)
 WINDOW_CENTER = roundV(scaleV(WINDOW_SIZE, 0.5))
+EDGE_RENDERER = "instanced" # "instanced" or "perPixel" (see shaders.initSurface)
+IDLE_WAIT = 250 # Longest time (ms) to sleep waiting for input when nothing on screen is changing
+MAX_FRAME_RATE = 240 # Frames per second are capped at this, in case presenting doesn't wait for the display
+STATUS_TIME = 3 # Seconds a status message stays up
+
+# Startup (see main.py)
+
+STARTUP_BUDGET = 0.5 # Seconds the first frame should take to appear, counted from main.py starting
+STARTUP_CHECK = False # Whether to quit as soon as the game has started, reporting how long starting took
+
+# Render scale (only for instanced edges)
+
+RENDER_SCALE = None # Fraction of the window resolution edges are drawn at, or None to adapt it to FRAME_BUDGET
+RENDER_SCALES = (0.5, 0.625, 0.75, 0.875, 1) # The scales it adapts between
+FRAME_BUDGET = 1 / 60 # GPU time (s) a frame should take
+SCALE_DOWN_AT = 0.9 # Fraction of FRAME_BUDGET the average frame has to go over to step the scale down
+SCALE_UP_AT = 0.6 # Fraction of FRAME_BUDGET a frame at the next scale up is predicted to stay under to step up
+SCALE_COOLDOWN = 30 # Frames drawn after a step before the next one
+
+# Level of detail (see levelOfDetail)
+
+GLOW_HIDDEN_DEPTH = 1 - (1 / SHADER_PARAMETERS['glowBrightness'] - 1) / SHADER_PARAMETERS['depthFactor'] # Past this depth, glow is darker than the background
+LOD_QUALITY = "medium" # One of LOD_SETTINGS
+LOD_SETTINGS = { # (Shortest edge drawn in pixels, how close in pixels the ends of edges must be to draw them as one, depth past which edges have no glow)
+    "high": (0, 0, math.inf),
+    "medium": (0.5, 0.25, GLOW_HIDDEN_DEPTH),
+    "low": (2, 1, 0)
+}
+
+# Profiling
+
+PROFILE_WINDOW = 300 # Drawn frames the stage time percentiles are taken over
+PROFILE_TRACE = None # File to write every drawn frame's stage times to on quitting (.csv or .json), or None
 
 # World geometry
 
-WORLD_EYE_Z = -10
-WORLD_SCREEN_Z = -5
-ZOOM_PERSPECTIVE = scaleV(WINDOW_SIZE, 0.8)
-ZOOM_ORTHOGONAL = scaleV(WINDOW_SIZE, 0.4)
+WINDOW_ZOOM_PERSPECTIVE = np.array(scaleV(WINDOW_SIZE, ZOOM_PERSPECTIVE))
+WINDOW_ZOOM_ORTHOGONAL = np.array(scaleV(WINDOW_SIZE, ZOOM_ORTHOGONAL))
 WORLD_SUBEDGE_LENGTH = 0.05
 
 # Control
 
-ROT_SPEED_KEY = 0.05
-ROT_SPEED_KEYSLOW = 0.005
-ROT_SPEED_MOUSE = 0.005
-
-MAX_UNDOS = 10
+SIM_RATE = 120 # Simulation steps per second (see simulationSteps)
+MAX_SIM_STEPS = 12 # Most steps a frame catches up on, past which the time is dropped instead
+ROT_SPEED_KEY = 3 # Radians per second
+ROT_SPEED_KEYSLOW = 0.3
+ROT_SPEED_MOUSE = 0.005 # Radians per pixel
+ROT_RENORMALIZE_INTERVAL = 100 # Rotations between renormalizing the orientation
+SNAP_SPEED = 3.6 # Fraction of a snap completed per second
+PULSE_SPEED = 13.4 # How fast a pulse fades (the fraction left falls by a factor of e every 1 / PULSE_SPEED seconds)
 
-VERTEX_RADIUS_SQUARED = math.pow(40, 2)
+VERTEX_RADIUS = 40 # How close the mouse has to be to pick a vertex, also the picking grid's cell size
+EDGE_RADIUS = 20 # Same for edges
 
 # Keybinds
 
@@ -75,35 +115,31 @@ KEY_COMMAND = K_LCTRL
 KEY_TOG_DEPTH = K_d
 KEY_TOG_VIEW = K_v
 KEY_TOG_DEBUG = K_9
+KEY_SNAP = K_f
 
 KEY_RESET = K_r
 KEY_UNDO = K_z
+KEY_REDO = K_y
 KEY_SAVE = K_s
 KEY_OPEN = K_o
+KEY_NEXTLEVEL = K_n
+KEY_PREVLEVEL = K_p
 
 KEY_QUIT = K_q
 
+IO_DONE = pygame.event.custom_type() # Posted by the I/O worker when a save or open finishes (see startIO)
+
 class App:
 
     def __init__(self):
         self.clock = pygame.time.Clock()
-        self.display = shaders.initSurface(WINDOW_SIZE)
-        self.windowSurface = pygame.Surface(WINDOW_SIZE)
+        self.display = shaders.initSurface(WINDOW_SIZE, EDGE_RENDERER)
+        startupTrace.mark("window")
 
         # Shader parameters
         shaders.setUniform('scale', WINDOW_SIZE)
-
-        shaders.setUniform('gradientTop', (0, 0, 0.25))
-        shaders.setUniform('gradientBot', (0.16, 0, 0.2))
-
-        shaders.setUniform('edgeBrightness', 2)
-        shaders.setUniform('glowBrightness', 0.3)
-        shaders.setUniform('edgeRadius', 0.00)
-        shaders.setUniform('edgeAntiAlias', 0.004)
-        shaders.setUniform('glowRadius', 0.03)
-        shaders.setUniform('depthFactor', 4)
-        shaders.setUniform('edgeWhitening', 0.075)
-        shaders.setUniform('vertexHighlightRadius', 0.015)
+        for name, value in SHADER_PARAMETERS.items():
+            shaders.setUniform(name, value)
 
         self.actionPulseFactor = 1
         self.placePulse = 1.25
@@ -119,6 +155,17 @@ class App:
         self.previousMousePos = (0, 0)
         self.previousClosestV = -1
 
+        # What the last presented frame showed (see loop), and how much it uploaded
+        self.presentedState = None
+        self.bytesUploaded = 0
+        self.profiler = Profiler(PROFILE_WINDOW, PROFILE_TRACE is not None)
+
+        # For the render scale (see adaptRenderScale)
+        self.renderScale = RENDER_SCALE if RENDER_SCALE is not None else 1
+        self.renderTime = None # Average GPU time of recent frames
+        self.renderScaleCooldown = 0
+        shaders.setRenderScale(self.renderScale)
+
         # For selecting an edge (via two vertices)
         self.selectedV = -1
         self.dragSelect = True
@@ -136,16 +183,44 @@ class App:
         self.buttonEdgeDotted = CircleButton(30, 500, 20, self.setEdgeStyle, ("dotted", True))
         self.buttons = [self.buttonEdgeWhite, self.buttonEdgeRed, self.buttonEdgeYellow, self.buttonEdgeBlue, self.buttonEdgeSolid, self.buttonEdgeDotted]
 
+        # For the simulation clock (see simulationSteps)
+        self.simulationTime = time.perf_counter()
+
+        # Edits are made on a worker thread (see editWireframe)
+        self.editWorker = concurrent.futures.ThreadPoolExecutor(1)
+        self.pendingEdit = None # (Future, whether to check the goal) while an edit is being made
+
+        # Saving and opening levels happen on another (see startIO)
+        self.ioWorker = concurrent.futures.ThreadPoolExecutor(1)
+        self.textEntry = None # (Prompt, text, function to submit it to) while a name is being typed
+        self.status = None # (Message, time to take it down) while one is up
+
+        # Edges left out by the last levelOfDetail
+        self.culledEdges = 0
+        shaders.setUniform('glowlessDepth', LOD_SETTINGS[LOD_QUALITY][2])
+
         # For rotation
-        self.wireframeUnitVectors = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+        self.rotationVersion = 0
+        self.rotationsSinceNormalize = 0
+        self.snap = None # (Start orientation, target orientation, progress) while snapping
+        self.setOrientation((1, 0, 0, 0))
+
+        # The last transformed vertices and what they were transformed for (see transformVertices)
+        self.transformKey = None
+        self.transformed = None
+        self.geometryKey = None # The transform last uploaded to the shaders
+
+        # The screen-space picking index and the transform it was built for (see screenIndex)
+        self.screenIndexKey = None
+        self.screenIndexCache = None
 
         # Initial level
-        self.loadLevel(loadFile("wireframes/custom/giza.txt"))
+        self.catalog = LevelCatalog()
+        self.openLevel("giza")
+        startupTrace.mark("level")
 
-        # Music and Sfx
-        loadMusic("Labrynth.mp3")
-        pygame.mixer.music.set_volume(0.3)
-        pygame.mixer.music.play(-1)
+        # Music and Sfx (the music and the mixer are started after the first frame, see startDeferred)
+        self.deferredStarted = False
 
         # Music colors:
         # Opulence - Red
@@ -165,56 +240,336 @@ class App:
         self.goalHideSound = loadSfx("sheet3.wav")
         self.undoSound = loadSfx("undo.wav")
         self.winSound = loadSfx("win.wav")
+        startupTrace.mark("setup")
 
         while True: self.loop()
 
+    # Starts what the first frame doesn't need, once it's on screen, and checks how long that took to get to
+    def startDeferred(self):
+        self.deferredStarted = True
+        startupTrace.markFirstFrame()
+
+        startAudio()
+        try:
+            loadMusic("Labrynth.mp3")
+            pygame.mixer.music.set_volume(0.3)
+            pygame.mixer.music.play(-1)
+        except pygame.error:
+            pass # The music isn't in the repository, so it may be missing
+        startupTrace.mark("audio")
+
+        overBudget = startupTrace.firstFrame > STARTUP_BUDGET
+        if overBudget or STARTUP_CHECK:
+            if overBudget: print("The first frame took longer than {} ms to appear:".format(round(STARTUP_BUDGET * 1000)))
+            print("\n".join(startupTrace.report()))
+        if STARTUP_CHECK: self.quit(1 if overBudget else 0)
+
     def setEdgeStyle(self, parameter, value):
         self.edgeStyle[parameter] = value
 
-    def worldToScreen(self, vertex):
+    # Projects an array of world positions (one per row) to screen positions
+    def worldToScreen(self, vertices):
         if self.perspective:
-            return addV(mulV(scaleV(vertex[0:2], (WORLD_SCREEN_Z - WORLD_EYE_Z) / (vertex[2] - WORLD_EYE_Z)), ZOOM_PERSPECTIVE), WINDOW_CENTER)
+            return vertices[:, 0:2] * ((WORLD_SCREEN_Z - WORLD_EYE_Z) / (vertices[:, 2] - WORLD_EYE_Z))[:, None] * WINDOW_ZOOM_PERSPECTIVE + WINDOW_CENTER
         else:
-            return addV(mulV(vertex[0:2], ZOOM_ORTHOGONAL), WINDOW_CENTER)
-        
-    def rotateWireframeUnitVectors(self, rotation):
+            return vertices[:, 0:2] * WINDOW_ZOOM_ORTHOGONAL + WINDOW_CENTER
+
+    # Returns the world and screen positions of every vertex slot (dead ones included, so they can be indexed
+    # by vertex id), and the packed geometry for shaders.setVertices, setEdgeLinks and setEdgeInstances. They are
+    # only recomputed when the wireframe, the rotation or the view changes.
+    def transformVertices(self, wireframe):
+        key = (wireframe.version, self.rotationVersion, self.perspective)
+        if key != self.transformKey:
+            worldVertices = wireframe.getWorldVertices(self.wireframeUnitVectors)
+            screenVertices = self.worldToScreen(worldVertices)
+            vertexIds, _, edges = wireframe.getPackedArrays()
+            edges = edges[self.levelOfDetail(edges, screenVertices[vertexIds], worldVertices[vertexIds, 2])]
+            self.culledEdges = wireframe.numEdges - len(edges)
+            ends = vertexIds[edges]
+            self.transformKey = key
+            self.transformed = (
+                worldVertices,
+                [tuple(p) for p in screenVertices.tolist()],
+                np.hstack((screenVertices[vertexIds], worldVertices[vertexIds, 2:3])).astype(np.float32),
+                edges.astype(np.float32),
+                np.hstack((screenVertices[ends[:, 0]], screenVertices[ends[:, 1]], worldVertices[ends, 2])).astype(np.float32)
+            )
+        return self.transformed
+
+    # Returns which of the packed edges (as indices) are worth drawing, given the screen positions and world Zs of
+    # the packed vertices. Dense wireframes have many edges that add nothing to the picture:
+    # - Edges shorter than the shortest drawn length, when both their ends meet longer edges (whose glow covers theirs)
+    # - Edges whose ends project onto the ends of another edge (to within the merge distance) that is in front of
+    #   them at both ends (so it is the brighter one along the whole length). Edges that cross in depth are all kept.
+    def levelOfDetail(self, edges, screenVertices, vertexZs):
+        minLength, mergeDistance, _ = LOD_SETTINGS[LOD_QUALITY]
+        starts, ends = screenVertices[edges[:, 0]], screenVertices[edges[:, 1]]
+
+        short = np.hypot(*(ends - starts).T) < minLength
+        longDegrees = np.bincount(edges[~short].ravel(), minlength = len(screenVertices))
+        kept = np.flatnonzero(~short | (longDegrees[edges] == 0).any(1))
+
+        if mergeDistance > 0 and len(kept) > 1:
+            cells = np.round(np.hstack((starts[kept], ends[kept])) / mergeDistance).astype(np.int64)
+            flip = (cells[:, 0] > cells[:, 2]) | ((cells[:, 0] == cells[:, 2]) & (cells[:, 1] > cells[:, 3])) # Either end can come first
+            cells[flip] = cells[flip][:, [2, 3, 0, 1]]
+            zs = vertexZs[edges[kept]]
+            zs[flip] = zs[flip][:, ::-1] # Matching the order of the ends in cells
+            order = np.lexsort((zs.sum(1), *cells.T[::-1]))
+            first = np.ones(len(order), bool)
+            first[1:] = (cells[order[1:]] != cells[order[:-1]]).any(1)
+            front = order[first][np.cumsum(first) - 1] # The frontmost edge of each edge's group, on average
+            covered = (zs[front] <= zs[order]).all(1)
+            kept = np.sort(kept[order[first | ~covered]])
+        return kept
+
+    # Returns a ScreenIndex over the last transformed vertices (the ones on screen this frame), built the first
+    # time it is needed after the projection changes, so frames that don't pick anything never build one.
+    def screenIndex(self, wireframe):
+        if self.screenIndexKey != self.transformKey:
+            edges = {e: tuple(wireframe.edgeVertices[e].tolist()) for e in wireframe.liveEdges().tolist()}
+            self.screenIndexCache = ScreenIndex(self.transformed[1], wireframe.liveVertices().tolist(), edges, VERTEX_RADIUS)
+            self.screenIndexKey = self.transformKey
+        return self.screenIndexCache
+
+    # Both return -1 when nothing is close enough to the mouse
+    def closestVertex(self, wireframe, mousePos, accept = None):
+        return self.screenIndex(wireframe).nearestVertex(mousePos, VERTEX_RADIUS, accept)
+
+    def closestEdge(self, wireframe, mousePos, accept = None):
+        return self.screenIndex(wireframe).nearestEdge(mousePos, EDGE_RADIUS, accept)
+
+    # Steps the render scale down when drawn frames take longer than the budget, and back up when the next scale
+    # up (whose cost is predicted from the pixel count) would fit comfortably.
+    def adaptRenderScale(self, renderTime):
+        if renderTime is None: return
+        self.renderTime = renderTime if self.renderTime is None else lerpFloat(self.renderTime, renderTime, 0.1)
+        if RENDER_SCALE is not None or EDGE_RENDERER != "instanced": return
+        if self.renderScaleCooldown > 0:
+            self.renderScaleCooldown -= 1
+            return
+
+        i = RENDER_SCALES.index(self.renderScale)
+        if self.renderTime > FRAME_BUDGET * SCALE_DOWN_AT and i > 0:
+            i -= 1
+        elif i < len(RENDER_SCALES) - 1 and self.renderTime * (RENDER_SCALES[i + 1] / self.renderScale) ** 2 < FRAME_BUDGET * SCALE_UP_AT:
+            i += 1
+        else:
+            return
+
+        self.renderScale = RENDER_SCALES[i]
+        self.renderScaleCooldown = SCALE_COOLDOWN
+        self.renderTime = None
+        shaders.setRenderScale(self.renderScale)
+
+    # The orientation is a quaternion. wireframeUnitVectors is derived from it: each row is one of the
+    # wireframe's local axes in world space, so local positions times this matrix are world positions.
+    def setOrientation(self, q):
+        self.orientation = q
+        self.wireframeUnitVectors = quatToMatrix(q).T
+        self.rotationVersion += 1
+
+    # Rotates around the world x, y and z axes, in that order
+    def rotateWireframe(self, rotation):
+        q = self.orientation
         for worldAxis in range(3):
-            for localAxis in range(3):
-                self.wireframeUnitVectors[localAxis] = rotateVector3Axis(self.wireframeUnitVectors[localAxis], rotation[worldAxis], worldAxis)
+            if rotation[worldAxis] != 0:
+                q = quatMultiply(quatFromAxisAngle(tuple(int(i == worldAxis) for i in range(3)), rotation[worldAxis]), q)
+        if q is self.orientation: return
+
+        # Rounding errors build up over many rotations, so the quaternion is renormalized every so often
+        self.rotationsSinceNormalize += 1
+        if self.rotationsSinceNormalize >= ROT_RENORMALIZE_INTERVAL:
+            q = normalize(q)
+            self.rotationsSinceNormalize = 0
+
+        self.snap = None
+        self.setOrientation(q)
+
+    # Starts turning the wireframe so that the vertex pointing most towards the viewer points straight at them.
+    # Vertices of a symmetric wireframe often lie on its symmetry axes, which this lines up with the view.
+    def snapToVertex(self, wireframe):
+        # Not this frame's transform, which is of the wireframe before any edit the command just finished
+        worldVertices = wireframe.getWorldVertices(self.wireframeUnitVectors)
+        directions = [worldVertices[v] for v in wireframe.liveVertices().tolist() if magnitude(worldVertices[v]) > Wireframe.tolerance]
+        if not directions: return
+        front = min(directions, key = lambda d: d[2] / magnitude(d))
+        self.snap = (self.orientation, quatMultiply(quatBetweenVectors(tuple(front), (0, 0, -1)), self.orientation), 0)
+
+    def updateSnap(self):
+        if self.snap:
+            start, target, progress = self.snap
+            progress = min(progress + SNAP_SPEED / SIM_RATE, 1)
+            self.setOrientation(quatSlerp(start, target, progress * progress * (3 - 2 * progress)))
+            self.snap = (start, target, progress) if progress < 1 else None
     
     def vertexRadius(self, worldZ):
         return 10 - worldZ * 5
     
-    def loadLevel(self, f):
-        self.goalWireframe = jsonpickle.decode(f.read())
-        self.wireframeStack = [wireframeFromPreset(self.goalWireframe.preset)]
+    # Opens a level from the catalog by name (or its already loaded goal), returning whether there was one to open
+    def openLevel(self, name, goal = None):
+        if goal is None: goal = self.catalog.load(name)
+        if goal is None: return False
+        self.levelName = name
+        names = self.catalog.names()
+        pygame.display.set_caption("Wire Construction - {} ({} of {})".format(name, names.index(name) + 1, len(names)) if name in names else "Wire Construction - " + name)
+        self.loadLevel(goal)
+        return True
+
+    def loadLevel(self, goal):
+        self.finishEdit(block = True) # So an edit of the last level isn't swapped in afterwards
+        self.goalWireframe = goal
+        self.goalSignature = GoalSignature(self.goalWireframe)
+        self.wireframe = self.startingWireframe()
+        self.history = History()
+
+    def startingWireframe(self):
+        w = wireframeFromPreset(self.goalWireframe.preset)
+        w.setGoal(self.goalSignature)
+        return w
     
-    def quit(self):
+    # Returns how many simulation steps are due since the last frame. Anything that moves over time (rotation,
+    # snapping, pulses) moves in steps of 1 / SIM_RATE seconds, so it moves just as far whatever the frame rate.
+    # What's left of a step carries over to the next frame.
+    def simulationSteps(self):
+        now = time.perf_counter()
+        steps = int((now - self.simulationTime) * SIM_RATE)
+        if steps > MAX_SIM_STEPS:
+            steps = MAX_SIM_STEPS
+            self.simulationTime = now
+        else:
+            self.simulationTime += steps / SIM_RATE
+        return steps
+
+    # Starts an edit of the current wireframe through the history. Large edits (e.g. an edge that splits many
+    # others) can take several frames, so the edit is made to a copy on the worker thread while the current
+    # wireframe stays on screen, and finishEdit swaps the copy in when it's ready. An edit started while another
+    # is still pending waits for that one first, so it builds on its result.
+    def editWireframe(self, function, *args, checkGoal = False):
+        self.finishEdit(block = True)
+        wireframe = self.wireframe
+        def edit():
+            t = time.perf_counter()
+            return History.perform(wireframe, function, *args) + (time.perf_counter() - t,)
+        self.pendingEdit = (self.editWorker.submit(edit), checkGoal)
+
+    # Swaps in the pending edit if it's done (or once it is, if block). Only called between the stages of a
+    # frame, so everything a frame does sees the same version.
+    def finishEdit(self, block = False):
+        if self.pendingEdit is None or not (block or self.pendingEdit[0].done()): return
+        future, checkGoal = self.pendingEdit
+        self.pendingEdit = None
+        wireframe, ops, seconds = future.result()
+        self.profiler.record("edit", seconds)
+        if ops: self.history.push(ops)
+        self.wireframe = wireframe
+        if checkGoal: self.checkGoal(wireframe)
+
+    def checkGoal(self, wireframe):
+        with self.profiler.scope("goal check"):
+            won = wireframe.matchesGoal()
+        if won:
+            self.actionPulseFactor = self.winPulse
+            self.winSound.play()
+
+    # Saving and opening
+
+    # Runs job on the I/O worker, so the loop carries on drawing while files are read and written. When it's done,
+    # an IO_DONE event with the kind of job, the name it was for, and its result (or the exception it raised) is
+    # posted back to the loop, which hands it to finishIO.
+    def startIO(self, kind, name, job):
+        def run():
+            try:
+                result, error = job(), None
+            except Exception as e:
+                result, error = None, e
+            pygame.event.post(pygame.event.Event(IO_DONE, kind = kind, name = name, result = result, error = error))
+        self.ioWorker.submit(run)
+
+    # Saves the current wireframe (with every edit made so far) as a new level. Never replaces an existing one.
+    def saveLevel(self, name):
+        if name in self.catalog.levels:
+            self.setStatus("There is already a level named " + name)
+            return
+        self.finishEdit(block = True)
+        wireframe = self.wireframe
+        def save():
+            self.catalog.refresh() # In case the level was added since the catalog was last read
+            if name in self.catalog.levels: raise FileExistsError(name)
+            writeBinaryFile("wireframes/custom/" + name + ".wire", wireframeToBytes(wireframe))
+            self.catalog.refresh()
+        self.startIO("save", name, save)
+
+    # Opens the level with the name, or the only level the name matches in a search of the catalog
+    def findLevel(self, query):
+        def find():
+            self.catalog.refresh()
+            matches = [query] if query in self.catalog.levels else self.catalog.search(query)
+            return matches, self.catalog.load(matches[0]) if len(matches) == 1 else None
+        self.startIO("open", query, find)
+
+    def finishIO(self, event):
+        if event.error is not None:
+            self.setStatus("Couldn't {} {} ({})".format(event.kind, event.name, type(event.error).__name__))
+        elif event.kind == "save":
+            self.setStatus("Saved " + event.name)
+        else:
+            matches, goal = event.result
+            if goal is not None:
+                self.openLevel(matches[0], goal)
+            elif matches:
+                self.setStatus("Levels matching {}: {}".format(event.name, ", ".join(matches[:4]) + (", ..." if len(matches) > 4 else "")))
+            else:
+                self.setStatus("No level named " + event.name)
+
+    def setStatus(self, message):
+        self.status = (message, time.perf_counter() + STATUS_TIME)
+
+    # Takes every key press while a name is being typed. Enter submits it and Escape closes the entry.
+    def typeIntoEntry(self, event):
+        prompt, text, submit = self.textEntry
+        if event.key == K_RETURN:
+            self.textEntry = None
+            if text: submit(text)
+        elif event.key == K_ESCAPE:
+            self.textEntry = None
+        elif event.key == K_BACKSPACE:
+            self.textEntry = (prompt, text[:-1], submit)
+        elif event.unicode and (event.unicode.isalnum() or event.unicode in "-_ "):
+            self.textEntry = (prompt, text + event.unicode, submit)
+
+    def quit(self, status = 0):
+        self.editWorker.shutdown(cancel_futures = True)
+        self.ioWorker.shutdown() # Lets a save finish
+        if PROFILE_TRACE is not None: self.profiler.dump(PROFILE_TRACE)
+        sfxCache.close()
         shaders.freeTextureMemory()
         pygame.quit()
-        sys.exit()
+        sys.exit(status)
 
     def loop(self):
-        timer = time.perf_counter()
-        self.windowSurface.fill((0, 0, 0))
+        self.profiler.beginFrame()
+        self.finishEdit()
 
         # Input
 
         keys = pygame.key.get_pressed()
+        if self.textEntry is not None: keys = collections.defaultdict(bool) # Typing doesn't control anything else
         mousePressed = pygame.mouse.get_pressed(3)
         mousePos = pygame.mouse.get_pos()
+        self.profiler.lap("input")
 
-        # Wireframe
+        # Wireframe (never modified in place: edits are made to a copy, which replaces it as a new version)
 
         if keys[KEY_GOAL]:
-            wireframe = copy.deepcopy(self.goalWireframe)
+            wireframe = self.goalWireframe
         else:
-            wireframe = copy.deepcopy(self.wireframeStack[-1])
+            wireframe = self.wireframe
 
         # Generating additional vertex and subedge data
 
-        worldVertices = wireframe.getWorldVertices(self.wireframeUnitVectors)
-        screenVertices = [self.worldToScreen(vertex) for vertex in worldVertices]
+        worldVertices, screenVertices, vertexData, edgeLinkData, edgeInstances = self.transformVertices(wireframe)
+        self.profiler.lap("transform")
 
         # Rotation control
 
@@ -225,83 +580,54 @@ class App:
         else:
             rotationSpeed = ROT_SPEED_KEY
 
+        # Every held key is added up into one rotation per second, which is turned through a step at a time
+        rotation = [0, 0, 0]
         if keys[KEY_UP]:
-            self.rotateWireframeUnitVectors((-rotationSpeed, 0, 0))
+            rotation[0] -= rotationSpeed
         if keys[KEY_DOWN]:
-            self.rotateWireframeUnitVectors((rotationSpeed, 0, 0))
+            rotation[0] += rotationSpeed
         if keys[KEY_LEFT]:
-            self.rotateWireframeUnitVectors((0, rotationSpeed, 0))
+            rotation[1] += rotationSpeed
         if keys[KEY_RIGHT]:
-            self.rotateWireframeUnitVectors((0, -rotationSpeed, 0))
+            rotation[1] -= rotationSpeed
         if keys[KEY_CCW]:
-            self.rotateWireframeUnitVectors((0, 0, -rotationSpeed))
+            rotation[2] -= rotationSpeed
         if keys[KEY_CW]:
-            self.rotateWireframeUnitVectors((0, 0, rotationSpeed))
+            rotation[2] += rotationSpeed
 
+        # The mouse turns by how far it moved since the last frame, however long that took
         if mousePressed[0] and self.panning:
             (mouseH, mouseV) = subV(mousePos, self.previousMousePos)
-            self.rotateWireframeUnitVectors(scaleV((mouseV, -mouseH, 0), ROT_SPEED_MOUSE))
+            self.rotateWireframe(scaleV((mouseV, -mouseH, 0), ROT_SPEED_MOUSE))
+
+        steps = self.simulationSteps()
+        for i in range(steps):
+            self.rotateWireframe(scaleV(rotation, 1 / SIM_RATE))
+            self.updateSnap()
+        self.profiler.lap("rotation")
 
-        # Closest vertex
+        # Closest vertex (nothing can be picked while an edit is pending, since ids on screen may not be valid in
+        # the edited wireframe)
 
         closestV = -1
-        if not keys[KEY_GOAL] and (keys[KEY_ADDEDGE] or keys[KEY_REMEDGE] or keys[KEY_REMVERTEX] or keys[KEY_EDTEDGE]) and not self.panning:
-            closestDS = -1 # Shortest distance squared so far
-            
-            for i in range(len(worldVertices)):
+        if self.pendingEdit is None and not keys[KEY_GOAL] and (keys[KEY_ADDEDGE] or keys[KEY_REMEDGE] or keys[KEY_REMVERTEX] or keys[KEY_EDTEDGE]) and not self.panning:
 
-                # Ignore conditions
+            # Ignore conditions
+            def accept(i):
                 if self.selectedV != -1:
-                    if keys[KEY_ADDEDGE] and {self.selectedV, i} in wireframe.edgeLinks: continue
-                    elif (keys[KEY_REMEDGE] or keys[KEY_EDTEDGE]) and {self.selectedV, i} not in wireframe.edgeLinks and self.selectedV != i: continue
+                    if keys[KEY_ADDEDGE] and wireframe.findEdge(self.selectedV, i) != -1: return False
+                    elif (keys[KEY_REMEDGE] or keys[KEY_EDTEDGE]) and wireframe.findEdge(self.selectedV, i) == -1 and self.selectedV != i: return False
+                return True
 
-                # Calculate distance
-                ds = distanceSquared(screenVertices[i], mousePos)
-                if closestV != -1:
-                    if ds < closestDS:
-                        closestV = i
-                        closestDS = ds
-                else:
-                    if ds < VERTEX_RADIUS_SQUARED:
-                        closestV = i
-                        closestDS = ds
+            closestV = self.closestVertex(wireframe, mousePos, accept)
         if closestV != -1 and self.previousClosestV != closestV and self.selectedV != closestV: self.hoverVertexSound.play()
+        self.profiler.lap("picking")
 
         # Drop selected vertex
 
         if not (keys[KEY_ADDEDGE] or keys[KEY_REMEDGE] or keys[KEY_EDTEDGE]):
             self.selectedV = -1
 
-        # Draw dragging edge
-
-        if mousePressed[0] and self.selectedV != -1 and not self.panning:
-            if closestV != -1:
-                pos = screenVertices[closestV]
-                if keys[KEY_ADDEDGE]:
-                    color = (0, 255, 0)
-                    radius = 1
-                elif keys[KEY_REMEDGE]:
-                    color = (255, 0, 0)
-                    radius = 2
-                elif keys[KEY_EDTEDGE]:
-                    color = (255, 255, 0)
-                    radius = 2
-            else:
-                pos = mousePos
-                if keys[KEY_ADDEDGE]:
-                    color = (200, 255, 200)
-                elif keys[KEY_REMEDGE]:
-                    color = (255, 200, 200)
-                elif keys[KEY_EDTEDGE]:
-                    color = (255, 255, 200)
-                radius = 1
-            
-            aaLine(self.windowSurface, screenVertices[self.selectedV], pos, radius, color)
-
-        if self.enableDebug:
-            for v in range(len(worldVertices)):
-                pygameDebug(self.windowSurface, addV(screenVertices[v], (-30, -30)), str(v))
-
         # Draw buttons
 
         # pygame.draw.circle(self.windowSurface, (255, 255, 255), self.buttonEdgeWhite.pos, 20)
@@ -316,21 +642,99 @@ class App:
         elif keys[KEY_REMEDGE] or keys[KEY_REMVERTEX]:
             hv = 2
 
-        shaders.writeToTexture(self.windowSurface)
-        shaders.setUniform('mousePos', mousePos)
-        shaders.setUniform('hasDepth', self.edgeDepth)
-        shaders.setUniform('pulseFactor', self.actionPulseFactor)
-        shaders.setUniform('highlightVertices', hv)
-        shaders.setUniform('hoveringVertex', closestV)
-        shaders.setUniform('selectedVertex', self.selectedV)
-        shaders.setUniform('numVertices', len(wireframe.vertices))
-        shaders.setUniform('numEdges', len(wireframe.edges))
-        shaders.setUniform('screenVertices', screenVertices[:256])
-        shaders.setUniform('vertexZs', [v[2] for v in worldVertices[:256]])
-        shaders.setUniform('edgeLinks', [tuple(e) for e in wireframe.edgeLinks[:256]])
-        shaders.renderTexture()
-
-        self.actionPulseFactor = lerpFloat(self.actionPulseFactor, 1, 0.2)
+        self.adaptRenderScale(shaders.takeRenderTime())
+
+        # Everything the frame shows depends on. When none of it changed, the last frame is still on screen, so
+        # drawing, uploading and flipping are all skipped.
+        modeKeys = (keys[KEY_ADDEDGE], keys[KEY_REMEDGE], keys[KEY_REMVERTEX], keys[KEY_EDTEDGE], keys[KEY_GOAL])
+        if self.status and time.perf_counter() > self.status[1]: self.status = None
+        frameState = (self.transformKey, mousePos, mousePressed[0], self.panning, modeKeys, closestV, self.selectedV, self.edgeDepth, self.actionPulseFactor, self.enableDebug, self.renderScale, self.textEntry, self.status)
+        redraw = frameState != self.presentedState
+        if redraw:
+            self.presentedState = frameState
+
+            # Draw dragging edge
+
+            dragging = mousePressed[0] and self.selectedV != -1 and not self.panning
+            if dragging:
+                if closestV != -1:
+                    pos = screenVertices[closestV]
+                    if keys[KEY_ADDEDGE]:
+                        color = (0, 255, 0)
+                        radius = 1
+                    elif keys[KEY_REMEDGE]:
+                        color = (255, 0, 0)
+                        radius = 2
+                    elif keys[KEY_EDTEDGE]:
+                        color = (255, 255, 0)
+                        radius = 2
+                else:
+                    pos = mousePos
+                    if keys[KEY_ADDEDGE]:
+                        color = (200, 255, 200)
+                    elif keys[KEY_REMEDGE]:
+                        color = (255, 200, 200)
+                    elif keys[KEY_EDTEDGE]:
+                        color = (255, 255, 200)
+                    radius = 1
+            
+                shaders.setUniform('dragStart', screenVertices[self.selectedV])
+                shaders.setUniform('dragEnd', pos)
+                shaders.setUniform('dragRadius', radius)
+                shaders.setUniform('dragColor', scaleV(color, 1 / 255))
+                dragging = pos != screenVertices[self.selectedV] # A line to itself isn't drawn
+            shaders.setUniform('dragging', dragging)
+
+            # The shader indexes packed arrays, which skip dead vertex slots
+            vertexIds, _, edges = wireframe.getPackedArrays()
+            packedId = lambda v: int(np.searchsorted(vertexIds, v)) if v != -1 else -1
+
+            shaders.setUniform('mousePos', mousePos)
+            shaders.setUniform('hasDepth', self.edgeDepth)
+            shaders.setUniform('pulseFactor', self.actionPulseFactor)
+            shaders.setUniform('highlightVertices', hv)
+            shaders.setUniform('hoveringVertex', packedId(closestV))
+            shaders.setUniform('selectedVertex', packedId(self.selectedV))
+            shaders.setUniform('numVertices', len(vertexIds))
+            shaders.setUniform('numEdges', len(edgeLinkData))
+            self.profiler.lap("uniforms")
+
+            # Debug labels (drawn from a glyph atlas, and only redrawn when they change)
+
+            labels = []
+            if self.enableDebug:
+                for v in wireframe.liveVertices().tolist():
+                    labels.append((addV(screenVertices[v], (-30, -30)), str(v), (255, 0, 0)))
+                labels.append(((10, 10), "Stage times (50th / 95th / 99th percentile):", (255, 0, 0)))
+                if wireframe.goal:
+                    labels.append(((10, 34), "Wrong vertices: {}, wrong edges: {}".format(*wireframe.distanceToGoal()), (255, 0, 0)))
+                labels.append(((10, 58), "Uploaded last frame: {} bytes, culled edges: {} of {}".format(self.bytesUploaded, self.culledEdges, wireframe.numEdges), (255, 0, 0)))
+                if self.renderTime is not None:
+                    labels.append(((10, 82), "GPU time: {} ms, render scale: {}".format(round(self.renderTime * 1000, 2), self.renderScale), (255, 0, 0)))
+                summary = self.profiler.summary()
+                for i, line in enumerate(summary):
+                    labels.append(((10, 106 + 24 * i), line, (255, 0, 0)))
+                seconds, loads = sfxCache.loadTime()
+                labels.append(((10, 106 + 24 * len(summary)), "Sounds loaded: {} in {:.2f} ms".format(loads, seconds * 1000), (255, 0, 0)))
+            if self.textEntry:
+                labels.append(((10, WINDOW_SIZE[1] - 34), self.textEntry[0] + self.textEntry[1] + "_", (255, 255, 255)))
+            elif self.status:
+                labels.append(((10, WINDOW_SIZE[1] - 34), self.status[0], (255, 255, 255)))
+            shaders.setLabels(labels, debugFont)
+
+            if self.geometryKey != self.transformKey:
+                shaders.setVertices(vertexData)
+                shaders.setEdgeLinks(edgeLinkData)
+                shaders.setEdgeInstances(edgeInstances)
+                self.geometryKey = self.transformKey
+            self.profiler.lap("textures")
+
+            shaders.renderTexture()
+            self.bytesUploaded = shaders.takeBytesUploaded()
+            self.profiler.lap("draw")
+
+        self.actionPulseFactor = lerpFloat(self.actionPulseFactor, 1, 1 - math.exp(-PULSE_SPEED * steps / SIM_RATE))
+        if abs(self.actionPulseFactor - 1) < 0.001: self.actionPulseFactor = 1 # Settle, so the frame can stop changing
 
         # Events (Modification of wireframe can only happen after this point)
 
@@ -339,9 +743,26 @@ class App:
             if event.type == QUIT:
                 self.quit()
 
+            # The window's contents may have been lost
+            if event.type in (VIDEOEXPOSE, WINDOWEXPOSED):
+                self.presentedState = None
+
+            if event.type == IO_DONE:
+                self.finishIO(event)
+
+            # While a name is being typed, every key goes to it
+            if self.textEntry is not None:
+                if event.type == KEYDOWN: self.typeIntoEntry(event)
+                if event.type in (KEYDOWN, KEYUP): continue
+
             # Commands
 
             if event.type == KEYDOWN and keys[KEY_COMMAND]:
+                if not keys[KEY_GOAL]:
+                    # Commands work on the wireframe with every edit made so far
+                    self.finishEdit(block = True)
+                    wireframe = self.wireframe
+
                 if event.key == KEY_QUIT:
                     self.quit()
                 elif event.key == KEY_TOG_DEPTH:
@@ -350,23 +771,26 @@ class App:
                     self.perspective = not self.perspective
                 elif event.key == KEY_TOG_DEBUG:
                     self.enableDebug = not self.enableDebug
+                elif event.key == KEY_SNAP:
+                    self.snapToVertex(wireframe)
                 elif event.key == KEY_RESET and not keys[KEY_GOAL]:
-                    self.wireframeStack.append(wireframeFromPreset(self.goalWireframe.preset))
+                    wireframe = self.wireframe = self.history.replace(wireframe, self.startingWireframe())
                     self.goalViewSound.play()
                 elif event.key == KEY_UNDO and not keys[KEY_GOAL]:
-                    if len(self.wireframeStack) > 1:
+                    if self.history.canUndo():
+                        self.undoSound.play()
+                        wireframe = self.wireframe = self.history.undo(wireframe)
+                elif event.key == KEY_REDO and not keys[KEY_GOAL]:
+                    if self.history.canRedo():
                         self.undoSound.play()
-                        self.wireframeStack.pop(-1)
+                        wireframe = self.wireframe = self.history.redo(wireframe)
                 elif event.key == KEY_SAVE and not keys[KEY_GOAL]:
-                    name = input("Wireframe name: ")
-                    writeTextFile("wireframes/custom/" + name + ".txt", jsonpickle.encode(wireframe))
+                    self.textEntry = ("Save as: ", "", self.saveLevel)
                 elif event.key == KEY_OPEN:
-                    name = input("Wireframe name: ")
-                    f = loadFile("wireframes/custom/" + name + ".txt")
-                    if f:
-                        self.loadLevel(f)
-                    else:
-                        print("No wireframe named " + name)
+                    self.textEntry = ("Open: ", "", self.findLevel)
+                elif event.key in (KEY_NEXTLEVEL, KEY_PREVLEVEL):
+                    name = self.catalog.step(self.levelName, 1 if event.key == KEY_NEXTLEVEL else -1)
+                    if name is not None: self.openLevel(name)
 
             # Vertex sounds
 
@@ -382,7 +806,9 @@ class App:
             # Vertex Selection and Button Presses
 
             elif event.type == MOUSEBUTTONDOWN and event.button == 1:
-                if closestV == -1:
+                if self.pendingEdit is not None:
+                    pass # Picking is off until the edit is in, so a click on a vertex would look like one on nothing
+                elif closestV == -1:
                     self.panning = True
                 elif (keys[KEY_ADDEDGE] or keys[KEY_REMEDGE] or keys[KEY_EDTEDGE]) and self.selectedV == -1 and closestV != -1 and not keys[KEY_GOAL]:
                     self.selectedV = closestV
@@ -418,48 +844,41 @@ class App:
 
                     if success:
                         if keys[KEY_ADDEDGE]:
-                            pygame.mixer.Sound.play(self.placeSound)
+                            self.placeSound.play()
                             self.actionPulseFactor = self.placePulse
-                            wireframe.addEdge(self.selectedV, closestV, self.edgeStyle)
-                            self.wireframeStack.append(wireframe)
-                            if wireframeEquality(wireframe, self.goalWireframe):
-                                self.actionPulseFactor = self.winPulse
-                                self.winSound.play()
+                            self.editWireframe(Wireframe.addEdge, self.selectedV, closestV, self.edgeStyle, checkGoal = True)
                         elif keys[KEY_REMEDGE]:
-                            pygame.mixer.Sound.play(self.breakSound)
-                            wireframe.removeEdge({self.selectedV, closestV})
-                            self.wireframeStack.append(wireframe)
-                            if wireframeEquality(wireframe, self.goalWireframe):
-                                self.actionPulseFactor = self.winPulse
-                                self.winSound.play()
+                            self.breakSound.play()
+                            self.editWireframe(Wireframe.removeEdge, {self.selectedV, closestV}, checkGoal = True)
                         elif keys[KEY_EDTEDGE]:
-                            pygame.mixer.Sound.play(self.placeSound)
-                            wireframe.editEdge({self.selectedV, closestV}, self.edgeStyle)
-                            self.wireframeStack.append(wireframe)
+                            self.placeSound.play()
+                            self.editWireframe(Wireframe.editEdge, {self.selectedV, closestV}, self.edgeStyle)
                         self.selectedV = -1
 
                 elif keys[KEY_REMVERTEX]:
                     if closestV != -1:
-                        pygame.mixer.Sound.play(self.breakSound)
-                        wireframe.clearVertex(closestV)
-                        self.wireframeStack.append(wireframe)
+                        self.breakSound.play()
+                        self.editWireframe(Wireframe.clearVertex, closestV, checkGoal = True)
                         self.selectedV = -1
-                        if wireframeEquality(wireframe, self.goalWireframe):
-                            self.actionPulseFactor = self.winPulse
-                            self.winSound.play()
-
-        # Cap undos
 
-        if len(self.wireframeStack) > MAX_UNDOS:
-            self.wireframeStack.pop(0)
+        self.profiler.lap("events")
 
         # Frame data
 
         self.previousMousePos = mousePos
-        self.previousClosestV = closestV
-
-        if self.enableDebug: pygameDebug(self.windowSurface, (10, 10), "Entire frame time: " + str(round((time.perf_counter() - timer) * 60, 2)))
-
-        pygame.display.flip()
-
-        self.clock.tick(60)
\ No newline at end of file
+        if self.pendingEdit is None: self.previousClosestV = closestV # Not while picking is off, so hovering doesn't sound again after an edit
+
+        if redraw:
+            pygame.display.flip()
+            self.profiler.lap("present")
+            self.profiler.endFrame()
+            if not self.deferredStarted: self.startDeferred()
+            self.clock.tick(MAX_FRAME_RATE)
+        elif any(rotation) or self.snap or self.actionPulseFactor != 1 or self.pendingEdit:
+            # Something will change, just not before the next step
+            time.sleep(max(0, self.simulationTime + 1 / SIM_RATE - time.perf_counter()))
+        else:
+            # Sleep until there is input, putting it back for the next frame. The time asleep isn't simulated.
+            event = pygame.event.wait(IDLE_WAIT)
+            if event.type != NOEVENT: pygame.event.post(event)
+            self.simulationTime = time.perf_counter()
\ No newline at end of file
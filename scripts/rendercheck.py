@@ -0,0 +1,58 @@
+import sys, math
+import numpy as np
+import pygame
+import shaders
+from softwarerenderer import *
+
+# Renders levels with both GL edge renderers (see shaders.initSurface) and with softwarerenderer, and checks that
+# no pixel differs by more than TOLERANCE between any two of them. Needs a window with an OpenGL 3.3 context.
+#
+# Usage: python rendercheck.py [level ...]
+# Checks the given levels in resources/wireframes/custom, or a few dense ones by default.
+
+SIZE = (700, 700)
+TOLERANCE = 1 # Per color channel, out of 255
+DEFAULT_LEVELS = ("rhombictriacontahedron", "icosidodecahedron", "giza")
+RENDERERS = ("perPixel", "instanced")
+
+# The uniforms every frame is drawn with. The mouse is off screen, so its cursor isn't drawn.
+UNIFORMS = {'hasDepth': 1, 'pulseFactor': 1, 'highlightVertices': 0, 'hoveringVertex': -1, 'selectedVertex': -1, 'mousePos': (-SIZE[0], -SIZE[1])}
+
+# Draws packed vertices and edges (from projectWireframe) the way the App does, and returns the frame as an
+# (height, width, 3) uint8 array with its top row first
+def renderFrameGL(renderer, vertices, edges):
+    shaders.initSurface(SIZE, renderer)
+    # Every edge keeps its glow, as at the "high" level of detail
+    for name, value in {'scale': SIZE, **SHADER_PARAMETERS, **UNIFORMS, 'glowlessDepth': math.inf, 'numVertices': len(vertices), 'numEdges': len(edges)}.items():
+        shaders.setUniform(name, value)
+    shaders.setVertices(vertices.astype(np.float32))
+    shaders.setEdgeLinks(edges.astype(np.float32))
+    shaders.setEdgeInstances(np.hstack((vertices[edges[:, 0], 0:2], vertices[edges[:, 1], 0:2], vertices[edges, 2])).astype(np.float32))
+    shaders.renderTexture()
+    image = np.frombuffer(shaders.screen.read(components = 3), np.uint8).reshape(SIZE[1], SIZE[0], 3)[::-1]
+    shaders.freeTextureMemory()
+    return image
+
+def largestDifference(image1, image2):
+    return int(np.abs(image1.astype(int) - image2.astype(int)).max())
+
+if __name__ == '__main__':
+    levels = sys.argv[1:] or DEFAULT_LEVELS
+    pygame.init()
+
+    failed = False
+    for level in levels:
+        vertices, edges = projectWireframe(loadWireframe("custom/" + level), THUMBNAIL_ORIENTATION, SIZE)
+        images = {"software": renderFrame(SIZE, vertices, edges, UNIFORMS)}
+        for renderer in RENDERERS:
+            images[renderer] = renderFrameGL(renderer, vertices, edges)
+
+        names = list(images)
+        for i, name1 in enumerate(names):
+            for name2 in names[i + 1:]:
+                difference = largestDifference(images[name1], images[name2])
+                failed |= difference > TOLERANCE
+                print("{}: {} vs {} differ by at most {}{}".format(level, name1, name2, difference, "" if difference <= TOLERANCE else " (too much)"))
+
+    pygame.quit()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,58 @@
+import random, sys, io, contextlib
+import numpy as np
+from wireframe import *
+from history import *
+
+# Plays a random session of edits, undos, redos and resets the way the App records them, then checks that
+# History.replay rebuilds the same wireframe from the one the session started with.
+#
+# Usage: python replaycheck.py [steps] [preset] [seed]
+
+STYLES = [Wireframe.defaultStyle, {"radius": 3, "color": (255, 120, 80), "dotted": True}]
+
+def randomEdit(w, rng):
+    vs = w.liveVertices().tolist()
+    kind = rng.choice(("add", "add", "remove", "clear", "style"))
+    if kind == "add":
+        return Wireframe.addEdge, rng.choice(vs), rng.choice(vs), rng.choice(STYLES)
+    if kind == "remove":
+        return Wireframe.removeEdge, set(rng.sample(vs, 2))
+    if kind == "clear":
+        return Wireframe.clearVertex, rng.choice(vs)
+    return Wireframe.editEdge, set(rng.sample(vs, 2)), rng.choice(STYLES)
+
+def playSession(start, steps, rng):
+    history = History()
+    w = start
+    for i in range(steps):
+        roll = rng.random()
+        if roll < 0.15 and history.canUndo():
+            w = history.undo(w)
+        elif roll < 0.25 and history.canRedo():
+            w = history.redo(w)
+        elif roll < 0.27 or w.numVertices < 2: # Resetting, which is also the only way on once too few vertices are left
+            w = history.replace(w, wireframeFromPreset(start.preset))
+        else:
+            w, ops = History.perform(w, *randomEdit(w, rng))
+            if ops: history.push(ops)
+    return history, w
+
+def sameWireframe(w1, w2):
+    packed1, packed2 = w1.getPackedArrays(), w2.getPackedArrays()
+    styles1, styles2 = ([w.edgeStyles[e] for e in w.liveEdges().tolist()] for w in (w1, w2))
+    return all(np.array_equal(a, b) for a, b in zip(packed1, packed2)) and styles1 == styles2 and wireframeEquality(w1, w2)
+
+if __name__ == '__main__':
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    preset = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    start = wireframeFromPreset(preset)
+    with contextlib.redirect_stdout(io.StringIO()): # testParallel prints every zero vector it finds
+        history, w = playSession(start, steps, random.Random(seed))
+        replayed = history.replay(start)
+    same = sameWireframe(w, replayed)
+
+    print("Played {} steps ({} logged) ending with {} vertices and {} edges".format(steps, len(history.log), w.numVertices, w.numEdges))
+    print("Replay matches" if same else "Replay differs")
+    sys.exit(0 if same else 1)
@@ -1,4 +1,5 @@
 import moderngl, pygame
+import numpy as np
 from pygame.locals import *
 from array import array
 
@@ -15,16 +16,69 @@ void main() {
 }
 '''
 
+# Used by both ways of drawing edges (see initSurface)
+edge_functions = '''
+// Calculate d and z for the segment from v to w, whose ends have the world Zs vz and wz.
+void distanceToSegment(in vec2 p, in vec2 v, in vec2 w, in float vz, in float wz, out float d, out float z) {
+
+    // Algorithm for the distance from a point to a line segment.
+    float l2 = pow(v.x - w.x, 2) + pow(v.y - w.y, 2);
+    float t = (l2 == 0.0) ? 0 : max(0, min(1, dot(p - v, w - v) / l2));
+    vec2 proj = v + t * (w - v);
+    d = distance(p, proj);
+
+    // The Z coordinate of the point on the line segment closest to p.
+    z = vz + t * (wz - vz);
+}
+
+// Calculate b.
+void brightness(in float minD, in float worldZ, out float b) {
+
+    // "Frontness" ranges from 1 to 2*depthFactor+1, and represents a brightness multiplier.
+    float frontness = (hasDepth == 1) ? (-worldZ + 1) * depthFactor + 1 : 2 * depthFactor + 1;
+
+    // On an edge: The brightness should be high.
+    if (minD < edgeRadius) b = edgeBrightness * frontness;
+
+    // On the 'edge' of an edge: The brightness should be half. (For anti-aliasing)
+    else if (minD < edgeRadius + edgeAntiAlias) b = (edgeBrightness - (minD - edgeRadius) * (edgeBrightness - glowBrightness) / edgeAntiAlias) * frontness;
+
+    // Near an edge: The brightness should gradually scale down until it reaches 1.
+    else if (minD < edgeRadius + edgeAntiAlias + glowRadius) b = (1 - sin(3.14 * 0.5 * (minD - edgeRadius - edgeAntiAlias) / glowRadius)) * glowBrightness * frontness;
+
+    // Not near an edge.
+    else b = 1;
+}
+
+// The brightened color due to an edge d away whose closest point has the world Z coordinate z.
+vec3 edgeColor(in vec3 baseColor, in float d, in float z) {
+    float b;
+    brightness(d, z, b);
+
+    // Case 1: Not on an edge, just multiply by the brightness.
+    if (d >= edgeRadius + edgeAntiAlias) return baseColor * b;
+    // Case 2: On an edge, add some whitening.
+    else return (baseColor + edgeWhitening) * b;
+}
+'''
+
 frag_shader = '''
 #version 330 core
 
 uniform sampler2D tex;
+uniform sampler2D edgeTex;
 uniform vec2 scale;
 uniform vec3 gradientTop;
 uniform vec3 gradientBot;
 
 uniform vec2 mousePos;
 
+uniform int dragging;
+uniform vec2 dragStart;
+uniform vec2 dragEnd;
+uniform float dragRadius;
+uniform vec3 dragColor;
+
 uniform int hasDepth;
 
 uniform float pulseFactor;
@@ -44,9 +98,8 @@ uniform int selectedVertex;
 
 uniform int numVertices;
 uniform int numEdges;
-uniform vec2 screenVertices[256];
-uniform float vertexZs[256];
-uniform vec2 edgeLinks[256];
+uniform sampler2D vertexData; // Screen position and world Z of each vertex (see setVertices)
+uniform sampler2D edgeLinkData; // Vertex indices of each edge (see setEdgeLinks)
 
 in vec2 uvs;
 out vec4 f_color;
@@ -56,39 +109,29 @@ vec2 screenToUV(in vec2 sv) {
     return sv / scale;
 }
 
-// Calculate d and z.
-float distanceToLineSegment(in vec2 p, in int vIndex, in int wIndex, out float d, out float z) {
-    vec2 v = screenToUV(screenVertices[vIndex]);
-    vec2 w = screenToUV(screenVertices[wIndex]);
-
-    // Algorithm for the distance from a point to a line segment.
-    float l2 = pow(v.x - w.x, 2) + pow(v.y - w.y, 2);
-    if (l2 == 0.0) return distance(p, v);
-    float t = max(0, min(1, dot(p - v, w - v) / l2));
-    vec2 proj = v + t * (w - v);
-    d = distance(p, proj);
+''' + edge_functions + '''
 
-    // The Z coordinate of the point on the line segment closest to p.
-    z = vertexZs[vIndex] + t * (vertexZs[wIndex] - vertexZs[vIndex]);
+// Data textures are filled row by row, one item per texel.
+vec4 fetchData(in sampler2D data, in int i) {
+    int width = textureSize(data, 0).x;
+    return texelFetch(data, ivec2(i % width, i / width), 0);
 }
 
-// Calculate b.
-void brightness(in float minD, in float worldZ, out float b) {
-
-    // "Frontness" ranges from 1 to 2*depthFactor+1, and represents a brightness multiplier.
-    float frontness = (hasDepth == 1) ? (-worldZ + 1) * depthFactor + 1 : 2 * depthFactor + 1;
-
-    // On an edge: The brightness should be high.
-    if (minD < edgeRadius) b = edgeBrightness * frontness;
+vec2 screenVertex(in int i) {
+    return fetchData(vertexData, i).xy;
+}
 
-    // On the 'edge' of an edge: The brightness should be half. (For anti-aliasing)
-    else if (minD < edgeRadius + edgeAntiAlias) b = (edgeBrightness - (minD - edgeRadius) * (edgeBrightness - glowBrightness) / edgeAntiAlias) * frontness;
+float vertexZ(in int i) {
+    return fetchData(vertexData, i).z;
+}
 
-    // Near an edge: The brightness should gradually scale down until it reaches 1.
-    else if (minD < edgeRadius + edgeAntiAlias + glowRadius) b = (1 - sin(3.14 * 0.5 * (minD - edgeRadius - edgeAntiAlias) / glowRadius)) * glowBrightness * frontness;
+ivec2 edgeLink(in int i) {
+    return ivec2(fetchData(edgeLinkData, i).xy);
+}
 
-    // Not near an edge.
-    else b = 1;
+// Calculate d and z.
+void distanceToLineSegment(in vec2 p, in int vIndex, in int wIndex, out float d, out float z) {
+    distanceToSegment(p, screenToUV(screenVertex(vIndex)), screenToUV(screenVertex(wIndex)), vertexZ(vIndex), vertexZ(wIndex), d, z);
 }
 
 void main() {
@@ -97,36 +140,44 @@ void main() {
 
     float d; // The distance from the pixel to a line segment or vertex.
     float z; // The world Z coordinate of the point on a line segment closest to the pixel.
-    float b; // The brightness calculated from d and z.
 
-    vec3 maxColor = texture(tex, uvs).rgb + baseColor; // The brightest color calculated thus far.
-    
+    // Labels, drawn by text_frag_shader. (Its texture is upside down.)
+    vec3 overlay = texture(tex, vec2(uvs.x, 1 - uvs.y)).rgb;
+
+    // The line dragged from the selected vertex, faded out over its last pixel. (Pixel centers are at +0.5.)
+    if (dragging != 0) {
+        float l;
+        distanceToSegment(uvs * scale, dragStart + 0.5, dragEnd + 0.5, 0, 0, d, l);
+        overlay = max(overlay, dragColor * clamp(dragRadius + 0.75 - d, 0, 1));
+    }
+
+    vec3 maxColor = overlay + baseColor; // The brightest color calculated thus far.
+
+#ifdef INSTANCED_EDGES
+    // Brightening based on edge proximity, already drawn by edge_frag_shader. (Its texture is upside down.)
+    maxColor = max(maxColor, texture(edgeTex, vec2(uvs.x, 1 - uvs.y)).rgb);
+#else
     // Brightening based on edge proximity.
     for (int i = 0; i < numEdges; i++) {
     
         // Get the distance from the line segment and the corresponding Z coordinate.
-        distanceToLineSegment(uvs, int(edgeLinks[i][0]), int(edgeLinks[i][1]), d, z);
-
-        // Calculate the brightness.
-        brightness(d, z, b);
+        distanceToLineSegment(uvs, edgeLink(i).x, edgeLink(i).y, d, z);
 
         // Calculate the brightened color due to this edge and raise the max if applicable.
-        // Case 1: Not on an edge, just multiply by the brightness.
-        if (d >= edgeRadius + edgeAntiAlias) maxColor = max(maxColor, baseColor * b);
-        // Case 2: On an edge, add some whitening.
-        else maxColor = max(maxColor, (baseColor + edgeWhitening) * b);
+        maxColor = max(maxColor, edgeColor(baseColor, d, z));
     }
+#endif
 
     // Brightening based on vertex proximity while editing.
     if (highlightVertices != 0) {
         for (int i = 0; i < numVertices; i++) {
             
             // Get the distance squared to the vertex.
-            vec2 v = screenToUV(screenVertices[i]);
+            vec2 v = screenToUV(screenVertex(i));
             float vd = sqrt(pow(v.x - uvs.x, 2) + pow(v.y - uvs.y, 2));
 
             // Get vertex radius.
-            float r = vertexHighlightRadius - vertexZs[i] * 0.0075;
+            float r = vertexHighlightRadius - vertexZ(i) * 0.0075;
 
             // Determine the vertex color.
             vec3 c = (i == selectedVertex) ? vec3(1, 0.25, 1) : (i == hoveringVertex) ? vec3(1, 1, 0.25) : (highlightVertices == 1) ? vec3(0.25, 1, 0.25) : vec3(1, 0.25, 0.25);
@@ -137,7 +188,7 @@ void main() {
     }
 
     // Crosshair.
-    if (hoveringVertex != -1 && hoveringVertex != selectedVertex && (abs(uvs.x - screenToUV(screenVertices[hoveringVertex]).x) <= 0.001 || abs(uvs.y - screenToUV(screenVertices[hoveringVertex]).y) <= 0.001)) maxColor = max(maxColor, baseColor + 0.4);
+    if (hoveringVertex != -1 && hoveringVertex != selectedVertex && (abs(uvs.x - screenToUV(screenVertex(hoveringVertex)).x) <= 0.001 || abs(uvs.y - screenToUV(screenVertex(hoveringVertex)).y) <= 0.001)) maxColor = max(maxColor, baseColor + 0.4);
         
     // Vingette.
     float cornerDistance = min(min(uvs.x, uvs.y), min(1 - uvs.x, 1 - uvs.y));
@@ -155,49 +206,456 @@ void main() {
 }
 '''
 
+# Instanced edges: every edge is drawn as a quad around it, reaching as far as its glow, so each pixel only
+# does work for the edges near it. The quads are combined with max blending, like the loop in frag_shader.
+
+edge_vert_shader = '''
+#version 330 core
+
+uniform vec2 scale;
+uniform float edgeRadius;
+uniform float edgeAntiAlias;
+uniform float glowRadius;
+uniform int hasDepth;
+uniform float glowlessDepth;
+
+in vec2 corner; // Per vertex: (-1 or 1 along the edge, -1 or 1 across it)
+in vec4 ends; // Per instance: the screen positions of both ends of the edge
+in vec2 endZs; // Per instance: the world Z coordinates of both ends
+
+out vec2 uvs;
+flat out vec2 v;
+flat out vec2 w;
+flat out vec2 zs;
+flat out int hasGlow;
+
+void main() {
+    v = ends.xy / scale;
+    w = ends.zw / scale;
+    zs = endZs;
+
+    // Edges entirely further back than glowlessDepth are drawn without their glow.
+    hasGlow = (hasDepth == 1 && min(endZs.x, endZs.y) > glowlessDepth) ? 0 : 1;
+
+    // Grow the edge by its reach in every direction (an edge seen end-on is just a square).
+    float reach = edgeRadius + edgeAntiAlias + glowRadius * hasGlow;
+    vec2 along = (v == w) ? vec2(1, 0) : normalize(w - v);
+    vec2 across = vec2(-along.y, along.x);
+    uvs = ((corner.x < 0) ? v : w) + (corner.x * along + corner.y * across) * reach;
+
+    gl_Position = vec4(uvs.x * 2 - 1, 1 - uvs.y * 2, 0.0, 1.0);
+}
+'''
+
+edge_frag_shader = '''
+#version 330 core
+
+uniform vec3 gradientTop;
+uniform vec3 gradientBot;
+
+uniform int hasDepth;
+
+uniform float edgeBrightness;
+uniform float glowBrightness;
+uniform float edgeRadius;
+uniform float edgeAntiAlias;
+uniform float glowRadius;
+uniform float depthFactor;
+uniform float edgeWhitening;
+
+in vec2 uvs;
+flat in vec2 v;
+flat in vec2 w;
+flat in vec2 zs;
+flat in int hasGlow;
+out vec4 f_color;
+
+''' + edge_functions + '''
+
+void main() {
+    vec3 baseColor = gradientTop + (gradientBot - gradientTop) * uvs.y;
+
+    float d;
+    float z;
+    distanceToSegment(uvs, v, w, zs.x, zs.y, d, z);
+    if (hasGlow == 0 && d >= edgeRadius + edgeAntiAlias) discard;
+    f_color = vec4(edgeColor(baseColor, d, z), 1.0);
+}
+'''
+
+DATA_TEXTURE_WIDTH = 1024 # Items per row of the geometry textures
+
+# Labels: every glyph is a quad textured from an atlas of the font's characters, drawn into the overlay texture.
+
+text_vert_shader = '''
+#version 330 core
+
+uniform vec2 scale;
+uniform float atlasWidth;
+
+in vec2 corner; // Per vertex: (0 or 1, 0 or 1)
+in vec4 rect; // Per instance: left, top, width and height on screen
+in vec2 atlasRange; // Per instance: left and right of the glyph in the atlas
+in vec3 color; // Per instance
+
+out vec2 atlasUV;
+flat out vec3 glyphColor;
+
+void main() {
+    vec2 p = rect.xy + corner * rect.zw;
+    atlasUV = vec2(mix(atlasRange.x, atlasRange.y, corner.x) / atlasWidth, corner.y);
+    glyphColor = color;
+    gl_Position = vec4(p.x / scale.x * 2 - 1, 1 - p.y / scale.y * 2, 0.0, 1.0);
+}
+'''
+
+text_frag_shader = '''
+#version 330 core
+
+uniform sampler2D atlas;
+
+in vec2 atlasUV;
+flat in vec3 glyphColor;
+out vec4 f_color;
+
+void main() {
+    f_color = vec4(glyphColor * texture(atlas, atlasUV).r, 1.0);
+}
+'''
+
 ctx = None
 program = None
 render_object = None
 tex = None
-
-# Call before the frame loop
-def initSurface(size):
+vertex_data = None
+edge_link_data = None
+
+# Only used when drawing instanced edges
+edgeRenderer = None
+edge_program = None
+edge_render_object = None
+edge_corner_buffer = None
+edge_instance_buffer = None
+edge_tex = None
+edge_fbo = None
+screen = None
+windowSize = None
+numEdgeInstances = 0
+renderScale = None # Fraction of the window resolution instanced edges are drawn at
+render_query = None # Times the last renderTexture on the GPU
+renderQueried = False
+
+# Labels
+overlay_fbo = None
+text_program = None
+text_render_object = None
+text_corner_buffer = None
+text_instance_buffer = None
+glyph_atlas = None
+glyphs = {} # String -> (Float, Float, Int) (Left and right of each character in the atlas, and how far it advances)
+atlasFont = None
+labels = None # The labels in the overlay texture
+
+# Uniform handles are looked up once per name, and uniforms are only uploaded when their value changes
+uniforms = {} # String -> Uniform Array (The uniform in every program that uses it)
+uniformValues = {} # String -> Value (The last value uploaded)
+bytesUploaded = 0 # Everything written to the GPU since the last takeBytesUploaded
+
+# Call before the frame loop. edgeRenderer is "instanced" (a quad per edge) or "perPixel" (every pixel loops over
+# every edge).
+def initSurface(size, renderer = "instanced"):
     global ctx
     global program
     global render_object
     global tex
-
-    surf = pygame.display.set_mode(size, pygame.OPENGL | pygame.DOUBLEBUF)
+    global edgeRenderer
+    global edge_program
+    global edge_corner_buffer
+    global screen
+    global windowSize
+    global vertex_data
+    global edge_link_data
+    global overlay_fbo
+    global text_program
+    global text_corner_buffer
+    global labels
+    global render_query
+
+    uniforms.clear()
+    uniformValues.clear()
+
+    # Presenting waits for the display's refresh where the driver allows it
+    try:
+        surf = pygame.display.set_mode(size, pygame.OPENGL | pygame.DOUBLEBUF, vsync = 1)
+    except pygame.error:
+        surf = pygame.display.set_mode(size, pygame.OPENGL | pygame.DOUBLEBUF)
     ctx = moderngl.create_context()
+    screen = ctx.fbo
+    windowSize = size
+    edgeRenderer = renderer
     quad_buffer = ctx.buffer(data = array('f', [
         -1.0, 1.0, 0.0, 0.0,
         1.0, 1.0, 1.0, 0.0,
         -1.0, -1.0, 0.0, 1.0,
         1.0, -1.0, 1.0, 1.0
     ]))
-    program = ctx.program(vertex_shader=vert_shader, fragment_shader=frag_shader)
+    if edgeRenderer == "instanced":
+        program = ctx.program(vertex_shader=vert_shader, fragment_shader=frag_shader.replace("#version 330 core\n", "#version 330 core\n#define INSTANCED_EDGES\n", 1))
+    else:
+        program = ctx.program(vertex_shader=vert_shader, fragment_shader=frag_shader)
     render_object = ctx.vertex_array(program, [(quad_buffer, '2f 2f', 'vert', 'texcoord')])
 
-    tex = ctx.texture(size, 4)
+    # Labels are drawn into tex, which stays empty unless there are some
+    tex = ctx.texture(size, 3)
     tex.filter = (moderngl.NEAREST, moderngl.NEAREST)
-    tex.swizzle = 'BGRA'
     tex.use(0)
-    program['tex'] = 0
+    overlay_fbo = ctx.framebuffer(color_attachments=[tex])
+    overlay_fbo.clear()
+    labels = []
+    text_program = ctx.program(vertex_shader=text_vert_shader, fragment_shader=text_frag_shader)
+    text_corner_buffer = ctx.buffer(data = array('f', [0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 1.0, 1.0]))
+    setVertices(np.zeros((0, 3), np.float32))
+    setEdgeLinks(np.zeros((0, 2), np.float32))
 
-    return surf
+    if edgeRenderer == "instanced":
+        edge_program = ctx.program(vertex_shader=edge_vert_shader, fragment_shader=edge_frag_shader)
+        edge_corner_buffer = ctx.buffer(data = array('f', [-1.0, -1.0, 1.0, -1.0, -1.0, 1.0, 1.0, 1.0]))
+        setEdgeInstances(array('f'))
 
-# Call every frame, after the surface is done generating
-def writeToTexture(surf):
-    tex.write(surf.get_view('1'))
+        setRenderScale(1)
 
-# Call whenever you want a uniform to change (e.g. every frame)
-def setUniform(name, value):
-    program[name] = value
+    # Everything drawn with blending (instanced edges and labels) keeps the brightest color
+    ctx.blend_equation = moderngl.MAX
 
-# Call every frame, after writing the texture and settings its uniforms
-def renderTexture():
-    render_object.render(mode=moderngl.TRIANGLE_STRIP)
+    render_query = ctx.query(time = True)
+
+    # Texture units
+    setUniform('tex', 0)
+    setUniform('edgeTex', 1)
+    setUniform('vertexData', 2)
+    setUniform('edgeLinkData', 3)
+    setUniform('atlas', 4)
 
-# Call upon exiting the program
+    return surf
+
+# Call whenever you want a uniform to change (e.g. every frame). Only uploads when the value is different from
+# last time. Arrays can be passed as packed bytes, which are written directly. Uniforms a program doesn't use are
+# skipped.
+def setUniform(name, value):
+    global bytesUploaded
+    if name in uniformValues and uniformValues[name] == value: return
+    if name not in uniforms:
+        uniforms[name] = [p[name] for p in (program, edge_program, text_program) if p is not None and p.get(name, None) is not None]
+
+    uniformValues[name] = bytes(value) if isinstance(value, (bytearray, memoryview)) else value
+    for uniform in uniforms[name]:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            uniform.write(value)
+            bytesUploaded += len(value)
+        else:
+            uniform.value = value
+            bytesUploaded += 4 * uniform.dimension * uniform.array_length
+
+# Returns how many bytes were uploaded since the last call (e.g. in the last frame)
+def takeBytesUploaded():
+    global bytesUploaded
+    uploaded, bytesUploaded = bytesUploaded, 0
+    return uploaded
+
+# Writes an array with one row of floats per item into a float texture with DATA_TEXTURE_WIDTH items per row,
+# which frag_shader reads with fetchData. The texture is written in place, and only replaced when it needs more
+# rows. Returns the texture to use from now on.
+def writeDataTexture(texture, data, unit):
+    global bytesUploaded
+    items, components = data.shape
+    rows = max(1, -(-items // DATA_TEXTURE_WIDTH))
+    if texture is None or texture.height < rows:
+        if texture is not None:
+            rows = max(rows, texture.height * 2)
+            texture.release()
+        texture = ctx.texture((DATA_TEXTURE_WIDTH, rows), components, dtype='f4')
+        texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
+        texture.use(unit)
+
+    data = np.ascontiguousarray(data, np.float32)
+    fullRows, remainder = divmod(items, DATA_TEXTURE_WIDTH)
+    if fullRows > 0: texture.write(data[:fullRows * DATA_TEXTURE_WIDTH], viewport=(0, 0, DATA_TEXTURE_WIDTH, fullRows))
+    if remainder > 0: texture.write(data[fullRows * DATA_TEXTURE_WIDTH:], viewport=(0, fullRows, remainder, 1))
+    bytesUploaded += data.nbytes
+    return texture
+
+# Call whenever the vertices change. Takes 3 floats per vertex: its screen position, then its world Z coordinate.
+def setVertices(data):
+    global vertex_data
+    vertex_data = writeDataTexture(vertex_data, data, 2)
+
+# Call whenever the edges change when drawing edges per pixel. Takes the 2 vertex indices of each edge (as floats).
+def setEdgeLinks(data):
+    global edge_link_data
+    if edgeRenderer != "instanced": edge_link_data = writeDataTexture(edge_link_data, data, 3)
+
+# Returns a buffer of at least the given size: the same one if it is big enough, otherwise a new one (releasing
+# the old one) twice as big, so that growing one item at a time doesn't replace it every time.
+def reserveBuffer(buffer, size):
+    if buffer is not None and buffer.size >= size: return buffer
+    reserve = 24 * 256
+    if buffer is not None:
+        reserve = buffer.size * 2
+        buffer.release()
+    return ctx.buffer(reserve = max(size, reserve), dynamic = True)
+
+# Call whenever the edges change when drawing instanced edges. Takes 6 floats per edge: the screen positions of
+# both ends, then the world Z coordinates of both ends. The buffer is written in place while it is big enough.
+def setEdgeInstances(data):
+    global edge_render_object
+    global edge_instance_buffer
+    global numEdgeInstances
+    global bytesUploaded
+
+    if edgeRenderer != "instanced": return
+    data = memoryview(data).cast('B')
+    buffer = reserveBuffer(edge_instance_buffer, len(data))
+    if buffer is not edge_instance_buffer:
+        if edge_render_object is not None: edge_render_object.release()
+        edge_instance_buffer = buffer
+        edge_render_object = ctx.vertex_array(edge_program, [
+            (edge_corner_buffer, '2f', 'corner'),
+            (edge_instance_buffer, '4f 2f/i', 'ends', 'endZs')
+        ])
+    if len(data) > 0: edge_instance_buffer.write(data)
+    numEdgeInstances = len(data) // 24
+    bytesUploaded += len(data)
+
+# Renders every printable ASCII character of the font side by side into a single channel texture
+def buildGlyphAtlas(font):
+    global glyph_atlas
+    global atlasFont
+
+    characters = [chr(c) for c in range(32, 127)]
+    surfaces = [font.render(c, True, (255, 255, 255)) for c in characters]
+    height = max(surface.get_height() for surface in surfaces)
+    coverage = np.zeros((height, sum(surface.get_width() for surface in surfaces)), np.uint8)
+    glyphs.clear()
+    left = 0
+    for c, surface in zip(characters, surfaces):
+        width = surface.get_width()
+        coverage[:surface.get_height(), left:left + width] = pygame.surfarray.array_alpha(surface).T
+        glyphs[c] = (left, left + width, font.size(c)[0])
+        left += width
+
+    if glyph_atlas is not None: glyph_atlas.release()
+    glyph_atlas = ctx.texture((coverage.shape[1], height), 1, coverage.tobytes())
+    glyph_atlas.filter = (moderngl.NEAREST, moderngl.NEAREST)
+    glyph_atlas.use(4)
+    atlasFont = font
+    setUniform('atlasWidth', coverage.shape[1])
+
+# Call whenever the labels might have changed. Takes (position, text, color) tuples, with positions in pixels from
+# the top left and colors from 0 to 255. Labels are redrawn into the overlay only when they are different.
+def setLabels(newLabels, font):
+    global labels
+    global text_render_object
+    global text_instance_buffer
+    global bytesUploaded
+
+    if newLabels == labels and font is atlasFont: return
+    labels = list(newLabels)
+    if font is not atlasFont: buildGlyphAtlas(font)
+
+    # One instance per glyph: its rect on screen, its range in the atlas and its color
+    instances = array('f')
+    for (x, y), text, color in labels:
+        x, y = int(x), int(y)
+        for c in text:
+            left, right, advance = glyphs.get(c, glyphs['?'])
+            instances.extend((x, y, right - left, glyph_atlas.height, left, right, color[0] / 255, color[1] / 255, color[2] / 255))
+            x += advance
+
+    overlay_fbo.use()
+    overlay_fbo.clear()
+    if len(instances) > 0:
+        buffer = reserveBuffer(text_instance_buffer, len(instances) * 4)
+        if buffer is not text_instance_buffer:
+            if text_render_object is not None: text_render_object.release()
+            text_instance_buffer = buffer
+            text_render_object = ctx.vertex_array(text_program, [
+                (text_corner_buffer, '2f', 'corner'),
+                (text_instance_buffer, '4f 2f 3f/i', 'rect', 'atlasRange', 'color')
+            ])
+        text_instance_buffer.write(instances)
+        bytesUploaded += len(instances) * 4
+        ctx.enable(moderngl.BLEND)
+        text_render_object.render(mode=moderngl.TRIANGLE_STRIP, instances=len(instances) // 9)
+        ctx.disable(moderngl.BLEND)
+    screen.use()
+
+# Instanced edges are drawn into a float texture (their colors can go well past 1, so they are kept as floats
+# until frag_shader is done with them). Below full scale it is smaller than the window, and frag_shader upscales it
+# with linear filtering. Does nothing when drawing edges per pixel. The texture is RGBA, since GL 3.3 only requires
+# RGBA float formats to be renderable; the alpha is never read.
+def setRenderScale(scale):
+    global edge_tex
+    global edge_fbo
+    global renderScale
+
+    if edgeRenderer != "instanced" or scale == renderScale: return
+    if edge_tex is not None:
+        edge_fbo.release()
+        edge_tex.release()
+    edge_tex = ctx.texture((max(1, round(windowSize[0] * scale)), max(1, round(windowSize[1] * scale))), 4, dtype='f4')
+    edge_tex.filter = (moderngl.NEAREST, moderngl.NEAREST) if scale == 1 else (moderngl.LINEAR, moderngl.LINEAR)
+    edge_tex.use(1)
+    edge_fbo = ctx.framebuffer(color_attachments=[edge_tex])
+    renderScale = scale
+
+# Call every frame, after setting the uniforms
+def renderTexture():
+    global renderQueried
+
+    with render_query:
+        if edgeRenderer == "instanced":
+            edge_fbo.use()
+            edge_fbo.clear()
+            if numEdgeInstances > 0:
+                ctx.enable(moderngl.BLEND)
+                edge_render_object.render(mode=moderngl.TRIANGLE_STRIP, instances=numEdgeInstances)
+                ctx.disable(moderngl.BLEND)
+            screen.use()
+        render_object.render(mode=moderngl.TRIANGLE_STRIP)
+    renderQueried = True
+
+# Returns how long (in seconds) the GPU spent on the last renderTexture, or None if it hasn't been called since the
+# last time. Waits for the GPU to finish it, so call it just before the next one rather than right after.
+def takeRenderTime():
+    global renderQueried
+    if not renderQueried: return None
+    renderQueried = False
+    return render_query.elapsed / 1e9
+
+# Call upon exiting the program, or before calling initSurface again (which then starts from nothing)
 def freeTextureMemory():
-    tex.release()
\ No newline at end of file
+    global vertex_data
+    global edge_link_data
+    global edge_tex
+    global edge_fbo
+    global renderScale
+    global edge_instance_buffer
+    global edge_render_object
+    global text_instance_buffer
+    global text_render_object
+    global glyph_atlas
+    global atlasFont
+
+    overlay_fbo.release()
+    tex.release()
+    if glyph_atlas is not None: glyph_atlas.release()
+    vertex_data.release()
+    if edge_link_data is not None: edge_link_data.release()
+    if edge_tex is not None:
+        edge_fbo.release()
+        edge_tex.release()
+    for buffer in (edge_render_object, edge_instance_buffer, text_render_object, text_instance_buffer):
+        if buffer is not None: buffer.release()
+    vertex_data = edge_link_data = edge_tex = edge_fbo = renderScale = None
+    edge_instance_buffer = edge_render_object = text_instance_buffer = text_render_object = None
+    glyph_atlas = atlasFont = None
@@ -0,0 +1,158 @@
+import sys, os, time, zlib, struct
+import numpy as np
+from wireframe import *
+from _resource import *
+from catalog import *
+from _view import *
+
+# A CPU version of shaders.frag_shader, for rendering wireframes without a GL context (level thumbnails, image
+# regression tests). Works on the whole pixel grid at once with NumPy, going through the edges in chunks so the
+# memory it needs doesn't grow with the wireframe. Labels and the drag line aren't drawn.
+#
+# Usage: python softwarerenderer.py [output directory] [image size]
+# Renders every level in resources/wireframes/custom to a PNG.
+
+EDGE_CHUNK = 16 # Edges per chunk
+
+THUMBNAIL_ORIENTATION = quatMultiply(quatFromAxisAngle((1, 0, 0), -0.4), quatFromAxisAngle((0, 1, 0), 0.6))
+
+
+# Geometry
+
+# Returns the packed vertices (screen x, screen y and world z of each) and packed edges of a wireframe, as the
+# shader gets them
+def projectWireframe(wireframe, orientation: tuple, size: tuple, perspective: bool = True):
+    vertexIds, _, edges = wireframe.getPackedArrays()
+    worldVertices = wireframe.getWorldVertices(quatToMatrix(orientation).T)[vertexIds]
+    size, center = np.array(size), np.array(roundV(scaleV(size, 0.5)))
+    if perspective:
+        screenVertices = worldVertices[:, 0:2] * ((WORLD_SCREEN_Z - WORLD_EYE_Z) / (worldVertices[:, 2] - WORLD_EYE_Z))[:, None] * size * ZOOM_PERSPECTIVE + center
+    else:
+        screenVertices = worldVertices[:, 0:2] * size * ZOOM_ORTHOGONAL + center
+    return np.hstack((screenVertices, worldVertices[:, 2:3])), edges
+
+
+# Shading
+
+# Everything below follows frag_shader line for line. Takes the uniforms frag_shader does (any that are missing
+# come from SHADER_PARAMETERS, or are off), and returns the image as an (height, width, 3) uint8 array.
+def renderFrame(size: tuple, vertices, edges, uniforms: dict = {}):
+    u = {**SHADER_PARAMETERS, 'hasDepth': 1, 'pulseFactor': 1, 'highlightVertices': 0, 'hoveringVertex': -1, 'selectedVertex': -1, 'mousePos': None, **uniforms}
+    width, height = size
+    scale = np.array(size, np.float32)
+
+    # Pixel centers as texture coordinates, (0, 0) at the top left
+    uvX = ((np.arange(width, dtype=np.float32) + 0.5) / width)[None, :]
+    uvY = ((np.arange(height, dtype=np.float32) + 0.5) / height)[:, None]
+
+    baseColor = np.array(u['gradientTop'], np.float32) + (np.array(u['gradientBot'], np.float32) - np.array(u['gradientTop'], np.float32)) * uvY[:, :, None]
+    maxColor = np.broadcast_to(baseColor, (height, width, 3)).copy()
+
+    uvVertices = vertices[:, 0:2].astype(np.float32) / scale
+    vertexZs = vertices[:, 2].astype(np.float32)
+
+    # Brightening based on edge proximity
+    reach = u['edgeRadius'] + u['edgeAntiAlias'] + u['glowRadius']
+    for start in range(0, len(edges), EDGE_CHUNK):
+        chunk = edges[start:start + EDGE_CHUNK]
+        v, w = uvVertices[chunk[:, 0]], uvVertices[chunk[:, 1]]
+
+        # Only the pixels the chunk's glow can reach
+        lower = np.floor((np.minimum(v, w).min(0) - reach) * scale).astype(int).clip(0, (width, height))
+        upper = np.ceil((np.maximum(v, w).max(0) + reach) * scale).astype(int).clip(0, (width, height))
+        if (upper <= lower).any(): continue
+        px, py = uvX[:, lower[0]:upper[0], None], uvY[lower[1]:upper[1], :, None]
+        base = baseColor[lower[1]:upper[1]]
+
+        d, z = distanceToSegments(px, py, v, w, vertexZs[chunk[:, 0]], vertexZs[chunk[:, 1]])
+        b = brightness(d, z, u)
+        onEdge = (d < u['edgeRadius'] + u['edgeAntiAlias'])[..., None]
+        colors = np.where(onEdge, (base[:, :, None, :] + u['edgeWhitening']) * b[..., None], base[:, :, None, :] * b[..., None])
+        region = maxColor[lower[1]:upper[1], lower[0]:upper[0]]
+        np.maximum(region, colors.max(2), out=region)
+
+    # Brightening based on vertex proximity while editing
+    if u['highlightVertices'] != 0:
+        for i in range(len(vertices)):
+            vd = np.sqrt((uvVertices[i, 0] - uvX) ** 2 + (uvVertices[i, 1] - uvY) ** 2)
+            r = u['vertexHighlightRadius'] - vertexZs[i] * 0.0075
+            if i == u['selectedVertex']: c = (1, 0.25, 1)
+            elif i == u['hoveringVertex']: c = (1, 1, 0.25)
+            elif u['highlightVertices'] == 1: c = (0.25, 1, 0.25)
+            else: c = (1, 0.25, 0.25)
+            highlight = baseColor + np.array(c, np.float32) * (1 - (vd / r) ** 16)[:, :, None]
+            maxColor = np.where((vd <= r)[:, :, None], np.maximum(maxColor, highlight), maxColor)
+
+    # Crosshair
+    hovering = u['hoveringVertex']
+    if hovering != -1 and hovering != u['selectedVertex']:
+        onCrosshair = (np.abs(uvX - uvVertices[hovering, 0]) <= 0.001) | (np.abs(uvY - uvVertices[hovering, 1]) <= 0.001)
+        maxColor = np.where(onCrosshair[:, :, None], np.maximum(maxColor, baseColor + 0.4), maxColor)
+
+    # Vignette
+    cornerDistance = np.minimum(np.minimum(uvX, uvY), np.minimum(1 - uvX, 1 - uvY))[:, :, None]
+    maxColor = np.where((cornerDistance < 0.0125) & (cornerDistance > 0.01), (maxColor + 0.1) * 3, maxColor * np.minimum((cornerDistance + 0.25) * 3, 1))
+
+    # Pulse factor
+    maxColor *= u['pulseFactor']
+
+    # Mouse
+    if u['mousePos'] is not None:
+        mouse = np.array(u['mousePos'], np.float32) / scale
+        mouseD = np.sqrt((mouse[0] - uvX) ** 2 + (mouse[1] - uvY) ** 2)[:, :, None]
+        maxColor = np.where(((mouseD > 0.006) & (mouseD < 0.0075)) | (mouseD < 0.002), 1 - np.minimum(maxColor, 1), maxColor)
+
+    return np.rint(np.clip(maxColor, 0, 1) * 255).astype(np.uint8)
+
+# The distance from each pixel to each segment, and the Z coordinate of the closest point on it. Pixels are
+# broadcast against the last axis, which has one entry per segment.
+def distanceToSegments(px, py, v, w, vz, wz):
+    vw = w - v
+    l2 = (vw ** 2).sum(1)
+    t = ((px - v[:, 0]) * vw[:, 0] + (py - v[:, 1]) * vw[:, 1]) / np.where(l2 == 0, 1, l2)
+    t = np.where(l2 == 0, 0, t.clip(0, 1))
+    d = np.sqrt((px - (v[:, 0] + t * vw[:, 0])) ** 2 + (py - (v[:, 1] + t * vw[:, 1])) ** 2)
+    return d, vz + t * (wz - vz)
+
+def brightness(d, z, u: dict):
+    frontness = (-z + 1) * u['depthFactor'] + 1 if u['hasDepth'] == 1 else 2 * u['depthFactor'] + 1
+    edgeRadius, antiAlias, glowRadius = u['edgeRadius'], u['edgeAntiAlias'], u['glowRadius']
+    return np.select(
+        [d < edgeRadius, d < edgeRadius + antiAlias, d < edgeRadius + antiAlias + glowRadius],
+        [u['edgeBrightness'] * frontness,
+         (u['edgeBrightness'] - (d - edgeRadius) * (u['edgeBrightness'] - u['glowBrightness']) / antiAlias) * frontness,
+         (1 - np.sin(3.14 * 0.5 * (d - edgeRadius - antiAlias) / glowRadius)) * u['glowBrightness'] * frontness],
+        1)
+
+def renderWireframe(wireframe, orientation: tuple = THUMBNAIL_ORIENTATION, size: tuple = (700, 700), perspective: bool = True, uniforms: dict = {}):
+    vertices, edges = projectWireframe(wireframe, orientation, size, perspective)
+    return renderFrame(size, vertices, edges, uniforms)
+
+
+# PNG
+
+def writePng(path: str, image):
+    height, width, _ = image.shape
+    chunk = lambda kind, data: struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = np.hstack((np.zeros((height, 1), np.uint8), image.reshape(height, width * 3))) # Filter type 0 on every row
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+if __name__ == '__main__':
+    outputDirectory = sys.argv[1] if len(sys.argv) > 1 else "thumbnails"
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 350
+    os.makedirs(outputDirectory, exist_ok=True)
+
+    catalog = LevelCatalog()
+    for name, entry in catalog.levels.items():
+        t = time.perf_counter()
+        if "error" in entry:
+            print("Skipped {} ({})".format(name, entry["error"]))
+            continue
+        wireframe = catalog.load(name)
+        writePng(os.path.join(outputDirectory, name + ".png"), renderWireframe(wireframe, size = (size, size)))
+        print("Rendered {} ({} edges) in {:.2f} s".format(name, wireframe.numEdges, time.perf_counter() - t))
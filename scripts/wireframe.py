@@ -1,16 +1,49 @@
-import math, copy
+import math, copy, itertools, json, struct, mmap
+import numpy as np
 from _linalg import *
+from _spatial import *
+from _resource import *
 
 class Wireframe:
 
     tolerance = 0.0001
 
+    # Spatial index settings. Cross checks are only run against the vertices and edges whose grid cells overlap
+    # the new edge's box. The box is padded in proportion to the edge's length, since testParallel's tolerance
+    # is an angle, which allows points to sit slightly off of a long edge and still count as crossing it.
+    gridCellSize = 0.25
+    gridPadding = 0.01
+
+    # Number of vertex and edge slots allocated up front. The arrays double in size when they run out.
+    initialCapacity = 32
+
+    # Every change to a wireframe's contents gets a new number from this, so equal versions mean equal contents
+    versions = itertools.count()
+
+    # How to copy each container that copies of a wireframe share until one of them writes to it
+    containerCopiers = {
+        "positions": np.copy,
+        "vertexAlive": np.copy,
+        "edgeVertices": np.copy,
+        "edgeAlive": np.copy,
+        "vertexLinks": lambda links: [set(l) for l in links],
+        "edgeStyles": list,
+        "edgeIndex": dict,
+        "vertexGrid": UniformGrid.copy,
+        "edgeGrid": UniformGrid.copy,
+        "vertexGoalIds": list,
+        "edgeGoalKeys": list,
+        "goalVertexHits": dict,
+        "goalEdgeHits": dict
+    }
+
     defaultStyle = {
         "radius": 2,
         "color": (255, 255, 255),
         "dotted": False
     }
 
+    # Only used to read files saved by older versions, which pickled a list of these objects.
     class Vertex:
         def __init__(self, id, localPosition):
             self.id = id # Int
@@ -21,30 +54,360 @@ class Wireframe:
             self.id = id # Int
             self.style = style # Dict
 
-    def __init__(self, vertexLocalPositions, edgeVertexConnections):
-        
-        # The lengths of vertices and vertexLinks should always be the same.
-        # The lengths of edges and edgeLinks should always be the same.
+    def __init__(self, vertexLocalPositions, edgeVertexConnections, edgeStyles = None):
+
+        # Vertex and edge ids are stable handles: they index directly into the arrays below and never change
+        # when something else is deleted (the undo journal depends on that). Deleting only marks the slot as dead
+        # (a tombstone). Dead slots are never saved (see getPackedArrays), so a reloaded level starts without any.
+        # The lengths of vertexLinks and edgeStyles are always vertexCount and edgeCount.
 
         self.preset = -1
+        self.version = next(Wireframe.versions)
+        self.shared = set() # Names of the containers that are shared with copies (see copy)
+        self.journal = None # Op Array (see startJournal)
+        self.packed = (-1, None) # The version and result of the last getPackedArrays
 
-        self.vertices = [] # Vertex Array
-        self.edges = [] # Edge Array
+        self.positions = np.zeros((max(len(vertexLocalPositions), Wireframe.initialCapacity), 3), np.float64) # Local position of each vertex slot
+        self.vertexAlive = np.zeros(len(self.positions), bool)
+        self.vertexCount = 0 # Number of vertex slots in use, dead or alive
+        self.numVertices = 0 # Number of live vertices
 
-        self.vertexLinks = [] # Int Set Array (Which edges are each vertex connected to?)
-        self.edgeLinks = [] # Int Set Array (Which vertices are each edge connected to?)
+        self.edgeVertices = np.zeros((max(len(edgeVertexConnections), Wireframe.initialCapacity), 2), np.int32) # Vertex ids of each edge slot
+        self.edgeAlive = np.zeros(len(self.edgeVertices), bool)
+        self.edgeCount = 0
+        self.numEdges = 0
 
-        for v in range(len(vertexLocalPositions)):
-            self.vertices.append(Wireframe.Vertex(v, vertexLocalPositions[v]))
-            self.vertexLinks.append(set())
+        self.vertexLinks = [] # Int Set Array (Which edges are each vertex connected to?)
+        self.edgeStyles = [] # Dict Array (None for dead edges)
+        self.edgeIndex = {} # Int Tuple -> Int (Which live edge connects each (min, max) vertex pair?)
+
+        self.vertexGrid = UniformGrid(Wireframe.gridCellSize)
+        self.edgeGrid = UniformGrid(Wireframe.gridCellSize)
+
+        # Progress towards a goal (see setGoal), kept up to date by every mutation
+        self.goal = None # GoalSignature
+        self.vertexGoalIds = [] # Int Array (Which goal vertex is each vertex at? -1 if none)
+        self.edgeGoalKeys = [] # Int Tuple Array (Which goal edge is each edge on? None if none)
+        self.goalVertexHits = {} # Int -> Int (How many vertices are at each goal vertex?)
+        self.goalEdgeHits = {} # Int Tuple -> Int (How many edges are on each goal edge?)
+        self.matchedVertices = 0
+        self.matchedEdges = 0
+
+        for p in vertexLocalPositions:
+            self.createVertex(p)
         for e in range(len(edgeVertexConnections)):
-            self.edges.append(Wireframe.Edge(e, Wireframe.defaultStyle))
-            self.vertexLinks[edgeVertexConnections[e][0]].add(e)
-            self.vertexLinks[edgeVertexConnections[e][1]].add(e)
-            self.edgeLinks.append({*edgeVertexConnections[e]})
+            self.createEdge(*edgeVertexConnections[e], edgeStyles[e] if edgeStyles else Wireframe.defaultStyle)
+
+    # Files store the packed arrays, so dead slots are never saved, and the grids are rebuilt when loading.
+
+    def __getstate__(self):
+        vertexIds, positions, edges = self.getPackedArrays()
+        return {
+            "preset": self.preset,
+            "positions": positions.tolist(),
+            "edges": edges.tolist(),
+            "styles": [self.edgeStyles[e] for e in self.liveEdges()]
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["positions"], state["edges"], state["styles"])
+        self.preset = state["preset"]
+
+    # Copy-on-write: the copy shares every container with this wireframe, and whichever of them is modified
+    # first copies just the containers it writes to. Copying is cheap, and a version that is being displayed is
+    # never changed by edits to its copies.
+    def copy(self):
+        w = Wireframe.__new__(Wireframe)
+        w.__dict__.update(self.__dict__)
+        self.shared = set(Wireframe.containerCopiers)
+        w.shared = set(Wireframe.containerCopiers)
+        w.journal = None
+        return w
+
+    # Call before writing to any of the named containers
+    def own(self, *names):
+        self.version = next(Wireframe.versions)
+        for name in names:
+            if name in self.shared:
+                setattr(self, name, Wireframe.containerCopiers[name](getattr(self, name)))
+                self.shared.discard(name)
+
+    # Converts a Wireframe decoded from an older file, which still has its vertices/edges/edgeLinks lists
+    @staticmethod
+    def fromLegacy(old):
+        w = Wireframe(
+            [v.localPosition for v in old.vertices],
+            [tuple(links) for links in old.edgeLinks],
+            [e.style for e in old.edges]
+        )
+        w.preset = old.preset
+        return w
+
+    # Storage
+
+    def position(self, v):
+        return tuple(self.positions[v].tolist())
+
+    def edgeLinks(self, e):
+        return set(self.edgeVertices[e].tolist())
+
+    def edgeStyle(self, e):
+        return self.edgeStyles[e]
+
+    def liveVertices(self):
+        return np.flatnonzero(self.vertexAlive[:self.vertexCount])
+
+    def liveEdges(self):
+        return np.flatnonzero(self.edgeAlive[:self.edgeCount])
+
+    # Returns the live vertex ids, their positions, and the live edges with their vertices renumbered to index
+    # into the packed positions (which is what the renderer and the serializer want). The result is kept until
+    # the next change, so it must not be modified.
+    def getPackedArrays(self):
+        if self.packed[0] != self.version:
+            vertexIds = self.liveVertices()
+            remap = np.full(self.vertexCount, -1, np.int32)
+            remap[vertexIds] = np.arange(len(vertexIds), dtype = np.int32)
+            self.packed = (self.version, (vertexIds, self.positions[vertexIds], remap[self.edgeVertices[self.liveEdges()]]))
+        return self.packed[1]
+
+    @staticmethod
+    def edgeKey(v1, v2):
+        return (v1, v2) if v1 < v2 else (v2, v1)
+
+    # Returns the id of the edge between v1 and v2, or -1 if there is none
+    def findEdge(self, v1, v2):
+        return self.edgeIndex.get(Wireframe.edgeKey(v1, v2), -1)
+
+    # Low-level changes. These are the only functions that change which vertices and edges exist, and each one
+    # records an op in the journal (see startJournal).
+
+    def createVertex(self, position):
+        self.own("positions", "vertexAlive", "vertexLinks", "vertexGoalIds")
+        if self.vertexCount == len(self.positions):
+            self.positions = np.concatenate((self.positions, np.zeros_like(self.positions)))
+            self.vertexAlive = np.concatenate((self.vertexAlive, np.zeros_like(self.vertexAlive)))
+        v = self.vertexCount
+        self.vertexCount += 1
+        self.positions[v] = position
+        self.vertexLinks.append(set())
+        self.vertexGoalIds.append(-1)
+        self.linkVertex(v)
+        self.record("createVertex", v, self.position(v))
+        return v
+
+    # The vertex must not have any edges
+    def deleteVertex(self, v):
+        self.unlinkVertex(v)
+        self.record("deleteVertex", v)
+
+    def createEdge(self, v1, v2, style):
+        v1, v2 = int(v1), int(v2)
+        self.own("edgeVertices", "edgeAlive", "edgeStyles", "edgeGoalKeys")
+        if self.edgeCount == len(self.edgeVertices):
+            self.edgeVertices = np.concatenate((self.edgeVertices, np.zeros_like(self.edgeVertices)))
+            self.edgeAlive = np.concatenate((self.edgeAlive, np.zeros_like(self.edgeAlive)))
+        e = self.edgeCount
+        self.edgeCount += 1
+        self.edgeVertices[e] = (v1, v2)
+        self.edgeStyles.append(style)
+        self.edgeGoalKeys.append(None)
+        self.linkEdge(e)
+        self.record("createEdge", e, v1, v2, style)
+        return e
+
+    def deleteEdge(self, e):
+        style = self.edgeStyles[e]
+        self.unlinkEdge(e)
+        self.own("edgeStyles")
+        self.edgeStyles[e] = None
+        self.record("deleteEdge", e, style)
+
+    def setEdgeStyle(self, e, style):
+        self.own("edgeStyles")
+        oldStyle = self.edgeStyles[e]
+        self.edgeStyles[e] = style
+        self.record("editEdge", e, oldStyle, style)
+
+    # Marking slots alive or dead, and keeping the indices and goal counts in step
+
+    def linkVertex(self, v):
+        self.own("vertexAlive", "vertexGrid")
+        self.vertexAlive[v] = True
+        self.numVertices += 1
+        p = self.position(v)
+        self.vertexGrid.insert(v, p, p)
+        if self.goal: self.trackVertex(v)
+
+    def unlinkVertex(self, v):
+        self.own("vertexAlive", "vertexGrid")
+        if self.goal: self.untrackVertex(v)
+        self.vertexGrid.remove(v)
+        self.vertexAlive[v] = False
+        self.numVertices -= 1
+
+    def linkEdge(self, e):
+        self.own("edgeAlive", "edgeIndex", "vertexLinks", "edgeGrid")
+        v1, v2 = self.edgeVertices[e].tolist()
+        self.edgeAlive[e] = True
+        self.numEdges += 1
+        self.edgeIndex[Wireframe.edgeKey(v1, v2)] = e
+        self.vertexLinks[v1].add(e)
+        self.vertexLinks[v2].add(e)
+        self.edgeGrid.insert(e, *self.edgeBounds(v1, v2))
+        if self.goal: self.trackEdge(e)
+
+    def unlinkEdge(self, e):
+        self.own("edgeAlive", "edgeIndex", "vertexLinks", "edgeGrid")
+        v1, v2 = self.edgeVertices[e].tolist()
+        if self.goal: self.untrackEdge(e)
+        del self.edgeIndex[Wireframe.edgeKey(v1, v2)]
+        self.vertexLinks[v1].discard(e)
+        self.vertexLinks[v2].discard(e)
+        self.edgeGrid.remove(e)
+        self.edgeAlive[e] = False
+        self.numEdges -= 1
+
+    # Journal
+
+    # While journaling, every low-level change is appended to the journal as an op tuple. Ops can be applied
+    # again with redo, or reverted with undo. Since ids are stable, ops stay valid as long as they are applied
+    # in order: reverting the newest ops first leaves the slots exactly as they were.
+
+    def startJournal(self):
+        self.journal = []
+
+    def stopJournal(self):
+        ops, self.journal = self.journal, None
+        return ops
+
+    def record(self, *op):
+        if self.journal is not None: self.journal.append(op)
+
+    def redo(self, ops):
+        for op in ops:
+            if op[0] == "createVertex": self.createVertex(op[2])
+            elif op[0] == "deleteVertex": self.deleteVertex(op[1])
+            elif op[0] == "createEdge": self.createEdge(op[2], op[3], op[4])
+            elif op[0] == "deleteEdge": self.deleteEdge(op[1])
+            elif op[0] == "editEdge": self.setEdgeStyle(op[1], op[3])
+
+    def undo(self, ops):
+        for op in reversed(ops):
+            if op[0] == "createVertex":
+                # The vertex was the newest slot, so it is removed entirely
+                self.unlinkVertex(op[1])
+                self.own("vertexLinks", "vertexGoalIds")
+                self.vertexLinks.pop()
+                self.vertexGoalIds.pop()
+                self.vertexCount -= 1
+            elif op[0] == "deleteVertex":
+                self.linkVertex(op[1])
+            elif op[0] == "createEdge":
+                self.unlinkEdge(op[1])
+                self.own("edgeStyles", "edgeGoalKeys")
+                self.edgeStyles.pop()
+                self.edgeGoalKeys.pop()
+                self.edgeCount -= 1
+            elif op[0] == "deleteEdge":
+                self.own("edgeStyles")
+                self.edgeStyles[op[1]] = op[2]
+                self.linkEdge(op[1])
+            elif op[0] == "editEdge":
+                self.own("edgeStyles")
+                self.edgeStyles[op[1]] = op[2]
+
+    # Goal tracking
+
+    # Starts counting how far this wireframe is from the goal. Every mutation after this updates the counts, so
+    # checking for a win doesn't need to compare the whole wireframe.
+    def setGoal(self, goal):
+        self.shared -= {"vertexGoalIds", "edgeGoalKeys", "goalVertexHits", "goalEdgeHits"}
+        self.goal = goal
+        self.vertexGoalIds = [-1] * self.vertexCount
+        self.edgeGoalKeys = [None] * self.edgeCount
+        self.goalVertexHits, self.goalEdgeHits = {}, {}
+        self.matchedVertices = self.matchedEdges = 0
+        for v in self.liveVertices().tolist():
+            self.trackVertex(v)
+        for e in self.liveEdges().tolist():
+            self.trackEdge(e)
+
+    def trackVertex(self, v):
+        self.own("vertexGoalIds", "goalVertexHits")
+        g = self.goal.matchVertex(self.position(v))
+        self.vertexGoalIds[v] = g
+        if g != -1:
+            self.matchedVertices += 1
+            self.goalVertexHits[g] = self.goalVertexHits.get(g, 0) + 1
+
+    def untrackVertex(self, v):
+        self.own("vertexGoalIds", "goalVertexHits")
+        g = self.vertexGoalIds[v]
+        if g != -1:
+            self.matchedVertices -= 1
+            self.goalVertexHits[g] -= 1
+            if not self.goalVertexHits[g]: del self.goalVertexHits[g]
+        self.vertexGoalIds[v] = -1
+
+    def trackEdge(self, e):
+        self.own("edgeGoalKeys", "goalEdgeHits")
+        g1, g2 = (self.vertexGoalIds[v] for v in self.edgeVertices[e].tolist())
+        key = Wireframe.edgeKey(g1, g2)
+        if g1 == -1 or g2 == -1 or key not in self.goal.edgePairs: return
+        self.edgeGoalKeys[e] = key
+        self.matchedEdges += 1
+        self.goalEdgeHits[key] = self.goalEdgeHits.get(key, 0) + 1
+
+    def untrackEdge(self, e):
+        self.own("edgeGoalKeys", "goalEdgeHits")
+        key = self.edgeGoalKeys[e]
+        if key is not None:
+            self.matchedEdges -= 1
+            self.goalEdgeHits[key] -= 1
+            if not self.goalEdgeHits[key]: del self.goalEdgeHits[key]
+        self.edgeGoalKeys[e] = None
+
+    # Returns how many vertices and how many edges are wrong: ones that aren't in the goal, plus goal ones
+    # that are missing
+    def distanceToGoal(self):
+        return (
+            (self.numVertices - self.matchedVertices) + (self.goal.numVertices - len(self.goalVertexHits)),
+            (self.numEdges - self.matchedEdges) + (self.goal.numEdges - len(self.goalEdgeHits))
+        )
+
+    def matchesGoal(self):
+        return self.goal is not None and self.distanceToGoal() == (0, 0)
+
+    def edgeBounds(self, v1, v2):
+        p1, p2 = self.position(v1), self.position(v2)
+        return pointsBounds((p1, p2), distance(p1, p2) * Wireframe.gridPadding + Wireframe.tolerance)
 
     def getWorldVertices(self, unitVectors):
-        return [[sum(unitVectors[i][axis] * v.localPosition[i] for i in range(3)) for axis in range(3)] for v in self.vertices]
+        return self.positions[:self.vertexCount] @ np.array(unitVectors, np.float64)
+
+    # Batched cross checks: the new edge (v1, v2) is tested against every candidate from the grids at once.
+    # Candidates are tested in id order, so the first hit is the same one the one-at-a-time checks would find.
+
+    # Returns the first vertex that the edge between v1 and v2 crosses, or -1 if there is none
+    def crossingVertex(self, v1, v2, bounds):
+        vs = np.fromiter(sorted(self.vertexGrid.query(*bounds)), np.int64)
+        vs = vs[(vs != v1) & (vs != v2)]
+        hits = vs[pointsOnSegmentBatch(self.positions[vs], self.positions[v1], self.positions[v2], Wireframe.tolerance)]
+        return int(hits[0]) if len(hits) else -1
+
+    # Returns the first edge that the edge between v1 and v2 crosses and the point of intersection, or -1 and None
+    def crossingEdge(self, v1, v2, bounds):
+        es = np.fromiter(sorted(self.edgeGrid.query(*bounds)), np.int64)
+        evs = self.edgeVertices[es]
+        unshared = np.all((evs != v1) & (evs != v2), axis = 1) # Edges that share a vertex with v1-v2 can't cross it
+        es, evs = es[unshared], evs[unshared]
+        crosses, intersections = segmentsCrossBatch(self.positions[evs[:, 0]], self.positions[evs[:, 1]], self.positions[v1], self.positions[v2], Wireframe.tolerance)
+        if not crosses.any(): return -1, None
+        i = int(np.argmax(crosses))
+        return int(es[i]), tuple(intersections[i].tolist())
+
+    # One-at-a-time versions of the cross checks. These are the reference for the batched ones (see benchmark.py).
 
     # Returns True if they cross and False otherwise
     def vertexEdgeCrossCheck(self, v, evs):
@@ -52,7 +415,7 @@ class Wireframe:
         if v in evs: return False
 
         # Parallel check
-        vp, ev1p, ev2p = (self.vertices[thisV].localPosition for thisV in [v] + list(evs))
+        vp, ev1p, ev2p = (self.position(thisV) for thisV in [v] + list(evs))
         return testParallel(subV(vp, ev1p), subV(vp, ev2p), Wireframe.tolerance) == 1
 
     # Returns the point of intersection if they cross and None otherwise
@@ -62,7 +425,7 @@ class Wireframe:
 
         # Calculate cross products
         levs1, levs2 = list(evs1), list(evs2)
-        path = [self.vertices[v].localPosition for v in [levs1[0], levs2[0], levs1[1], levs2[1]]]
+        path = [self.position(v) for v in [levs1[0], levs2[0], levs1[1], levs2[1]]]
         c1 = cross3(subV(path[1], path[0]), subV(path[2], path[1]))
         c2 = cross3(subV(path[3], path[2]), subV(path[0], path[3]))
         
@@ -113,59 +476,37 @@ class Wireframe:
             #print("Preparing to remove edge ", tuple(e))
             # e is a set; Check if evs actually exists
             evs = e
-            if evs not in self.edgeLinks:
+            e = self.findEdge(*evs)
+            if e == -1:
                 # e does not exist; Check for vertex crossings
-                for v in range(len(self.vertices)):
-                    if self.vertexEdgeCrossCheck(v, evs):
-                        # Crosses a vertex; Recursive call
-                        #print("Found intersecting vertex ", v)
-                        for thisV in evs:
-                            self.removeEdge(thisV, v)
-                        return
+                v = self.crossingVertex(*evs, self.edgeBounds(*evs))
+                if v != -1:
+                    # Crosses a vertex; Recursive call
+                    #print("Found intersecting vertex ", v)
+                    for thisV in evs:
+                        self.removeEdge({thisV, v})
                 return
-            else:
-                # e exists; set e to its edge index instead of its vertex links
-                e = self.edgeLinks.index(e)
 
         # e exists.
-        #print("Removing edge ", tuple(self.edgeLinks[e]))
-        # Remove edge links from linked vertices
-        for v in self.edgeLinks[e]:
-            self.vertexLinks[v].discard(e)
-        
-        # Delete edge
-        self.edges.pop(e)
-        self.edgeLinks.pop(e)
-        
-        # Shift edge ids
-        for v in range(len(self.vertices)):
-            self.vertexLinks[v] = {otherE - 1 if otherE > e else otherE for otherE in self.vertexLinks[v]}
-        for otherE in range(e, len(self.edges)):
-            self.edges[otherE].id -= 1
+        #print("Removing edge ", tuple(self.edgeLinks(e)))
+        self.deleteEdge(e)
 
     def clearVertex(self, v):
         delete = not self.vertexLinks[v]
 
         # Remove edges
-        for e in sorted(self.vertexLinks[v], key = lambda e: e, reverse = True):
+        for e in list(self.vertexLinks[v]):
             self.removeEdge(e)
-        
+
         if delete:
             # Delete vertex
-            self.vertices.pop(v)
-            self.vertexLinks.pop(v)
-            
-            # Shift vertex ids
-            for otherV in range(v, len(self.vertices)):
-                self.vertices[otherV].id -= 1
-            for e in range(len(self.edges)):
-                self.edgeLinks[e] = {otherV - 1 if otherV > v else otherV for otherV in self.edgeLinks[e]}
+            self.deleteVertex(v)
 
     def addEdge(self, v1, v2, style, checkCross = True):
         # Can't have an edge between two of the same vertex
         if v1 == v2: return
         # Can't make a duplicate edge
-        if {v1, v2} in self.edgeLinks: return
+        if self.findEdge(v1, v2) != -1: return
 
         #print("Preparing to add edge ", (v1, v2))
 
@@ -174,49 +515,47 @@ class Wireframe:
         # 2. Otherwise, if the edge crosses an edge, create a new vertex, and call this function recursively
 
         if checkCross:
-            for v in range(len(self.vertices)):
-                # Cross check
-                if self.vertexEdgeCrossCheck(v, {v1, v2}):
-                    # If True: Recursive call, return
-                    #print("Found intersection with vertex ", v)
-                    self.addEdge(v, v1, style)
-                    self.addEdge(v, v2, style)
-                    return
-            
-            for e in range(len(self.edges)):
+            # Only vertices and edges near the new edge can cross it
+            bounds = self.edgeBounds(v1, v2)
+
+            # Cross check
+            v = self.crossingVertex(v1, v2, bounds)
+            if v != -1:
+                # If True: Recursive call, return
+                #print("Found intersection with vertex ", v)
+                self.addEdge(v, v1, style)
+                self.addEdge(v, v2, style)
+                return
+
+            # Cross check
+            e, intersection = self.crossingEdge(v1, v2, bounds)
+            if e != -1:
                 # "evs": Edge's vertices
-                evs = self.edgeLinks[e]
-                # Cross check
-                intersection = self.edgeEdgeCrossCheck(evs, {v1, v2})
-                if intersection:
-                    #print("Found intersection with edge ", tuple(evs))
-                    # If True:
-                    # Remove crossing edge
-                    otherStyle = self.edges[e].style
-                    self.removeEdge(e)
-                    # Create new vertex
-                    newV = len(self.vertices)
-                    self.vertices.append(Wireframe.Vertex(newV, intersection))
-                    self.vertexLinks.append(set())
-                    # Create 4 new edges
-                    for otherV in evs:
-                        self.addEdge(otherV, newV, otherStyle, False)
-                    for thisV in {v1, v2}:
-                        self.addEdge(thisV, newV, style)
-                    return
-            
+                evs = self.edgeLinks(e)
+                #print("Found intersection with edge ", tuple(evs))
+                # If True:
+                # Remove crossing edge
+                otherStyle = self.edgeStyles[e]
+                self.removeEdge(e)
+                # Create new vertex
+                newV = self.createVertex(intersection)
+                # Create 4 new edges
+                for otherV in evs:
+                    self.addEdge(otherV, newV, otherStyle, False)
+                for thisV in {v1, v2}:
+                    self.addEdge(thisV, newV, style)
+                return
+
         # No crosses at all
         #print("Adding edge ", (v1, v2))
-        newE = len(self.edges)
-        self.edges.append(Wireframe.Edge(newE, copy.deepcopy(style)))
-        self.edgeLinks.append({v1, v2})
-        for v in {v1, v2}:
-            self.vertexLinks[v].add(newE)
+        self.createEdge(v1, v2, copy.deepcopy(style))
 
     def editEdge(self, e, style):
         if (isinstance(e, set)):
-            e = self.edgeLinks.index(e)
-        self.edges[e].style = copy.deepcopy(style)
+            e = self.findEdge(*e)
+            # e does not exist; Nothing to edit
+            if e == -1: return
+        self.setEdgeStyle(e, copy.deepcopy(style))
 
 d1 = 1 / math.sqrt(3)
 tetrahedronVertices = [
@@ -313,26 +652,118 @@ def wireframeFromPreset(id):
     w.preset = id
     return w
 
+# The parts of a goal wireframe needed to match another wireframe against it. Vertex positions are bucketed into
+# cells the size of the tolerance, so a position only needs to be compared with the goal vertices in its own and
+# neighbouring cells.
+class GoalSignature:
+
+    neighbourOffsets = [(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)]
+
+    def __init__(self, goal):
+        self.numVertices = goal.numVertices
+        self.numEdges = goal.numEdges
+
+        self.vertexPositions = {} # Int -> Float Vector3
+        self.vertexKeys = {} # Int Tuple -> Int Array (Which goal vertices are in each cell?)
+        for v in goal.liveVertices().tolist():
+            self.vertexPositions[v] = goal.position(v)
+            self.vertexKeys.setdefault(GoalSignature.positionKey(goal.position(v)), []).append(v)
+
+        self.edgePairs = frozenset(Wireframe.edgeKey(*goal.edgeVertices[e].tolist()) for e in goal.liveEdges().tolist())
+
+    @staticmethod
+    def positionKey(p):
+        return tuple([math.floor(c / Wireframe.tolerance) for c in p])
+
+    # Returns the goal vertex at position p, or -1 if there is none
+    def matchVertex(self, p):
+        key = GoalSignature.positionKey(p)
+        for offset in GoalSignature.neighbourOffsets:
+            for v in self.vertexKeys.get(addV(key, offset), ()):
+                if all(abs(c) <= Wireframe.tolerance for c in subV(p, self.vertexPositions[v])):
+                    return v
+        return -1
+
 def wireframeEquality(w1, w2):
-    if len(w1.vertices) != len(w2.vertices) or len(w1.edges) != len(w2.edges):
+    if w1.numVertices != w2.numVertices or w1.numEdges != w2.numEdges:
         return False
 
-    vMappings = {}
-    for v1 in range(len(w1.vertices)):
-        found = False
-        for v2 in range(len(w2.vertices)):
-            if all(abs(c) <= Wireframe.tolerance for c in subV(w1.vertices[v1].localPosition, w2.vertices[v2].localPosition)):
-                vMappings[v1] = v2
-                #print("Current wireframe", v1, "= Goal wireframe", v2)
-                found = True
-                break
-        if not found:
-            #print("Bad vertex")
-            return False
-        
-    for e1 in range(len(w1.edges)):
-        if {vMappings[v] for v in w1.edgeLinks[e1]} not in w2.edgeLinks:
-            #print("Bad edge: ", {vMappings[v] for v in w1.edgeLinks[e1]})
-            return False
-        
-    return True
\ No newline at end of file
+    goal = GoalSignature(w2)
+    vMappings = {v: goal.matchVertex(w1.position(v)) for v in w1.liveVertices().tolist()}
+    if -1 in vMappings.values() or len(set(vMappings.values())) != goal.numVertices:
+        #print("Bad vertex")
+        return False
+
+    edgePairs = {Wireframe.edgeKey(*(vMappings[v] for v in w1.edgeVertices[e].tolist())) for e in w1.liveEdges().tolist()}
+    return edgePairs == goal.edgePairs
+
+# Decodes a saved wireframe, converting it if it was saved by an older version. jsonpickle is only imported the
+# first time it's needed, since levels are usually loaded from binary files (see below).
+def wireframeFromText(text):
+    import jsonpickle
+    w = jsonpickle.decode(text)
+    if not hasattr(w, "positions"):
+        w = Wireframe.fromLegacy(w)
+    return w
+
+
+# Binary level files (.wire). After a header come the packed vertex positions (float64, 3 per vertex), the packed
+# edges (int32 vertex index pairs), each edge's index into the style table (int32), and the style table itself
+# (a JSON list of the distinct styles). The arrays are read straight out of the file's buffer, and nothing in the
+# file names code to run, unlike the jsonpickle text files (which are still read when there's no binary file).
+#
+# Header: magic, format version, preset, vertex count, edge count, style table length in bytes (little-endian)
+
+WIRE_MAGIC = b"WIRE"
+WIRE_VERSION = 1
+WIRE_HEADER = struct.Struct("<4sHhIII")
+
+def wireframeToBytes(w):
+    vertexIds, positions, edges = w.getPackedArrays()
+    styles, styleIds = [], []
+    for e in w.liveEdges().tolist():
+        style = w.edgeStyle(e)
+        if style not in styles: styles.append(style)
+        styleIds.append(styles.index(style))
+    styleTable = json.dumps(styles).encode()
+    return b"".join((
+        WIRE_HEADER.pack(WIRE_MAGIC, WIRE_VERSION, w.preset, len(positions), len(edges), len(styleTable)),
+        positions.astype("<f8").tobytes(),
+        edges.astype("<i4").tobytes(),
+        np.array(styleIds, "<i4").tobytes(),
+        styleTable
+    ))
+
+# Takes anything that supports the buffer protocol (bytes, an mmap). Raises ValueError if it isn't a .wire file of
+# a version this can read.
+def wireframeFromBytes(data):
+    if len(data) < WIRE_HEADER.size: raise ValueError("Not a wireframe file")
+    magic, version, preset, numVertices, numEdges, styleTableLength = WIRE_HEADER.unpack_from(data)
+    if magic != WIRE_MAGIC: raise ValueError("Not a wireframe file")
+    if version != WIRE_VERSION: raise ValueError("Unsupported wireframe file version {}".format(version))
+
+    offset = WIRE_HEADER.size
+    positions = np.frombuffer(data, "<f8", numVertices * 3, offset).reshape(numVertices, 3)
+    offset += positions.nbytes
+    edges = np.frombuffer(data, "<i4", numEdges * 2, offset).reshape(numEdges, 2)
+    offset += edges.nbytes
+    styleIds = np.frombuffer(data, "<i4", numEdges, offset)
+    offset += styleIds.nbytes
+
+    # JSON has no tuples, so colors come back as lists
+    styles = [{key: tuple(value) if isinstance(value, list) else value for key, value in style.items()} for style in json.loads(bytes(data[offset:offset + styleTableLength]))]
+    w = Wireframe(positions, edges, [styles[i] for i in styleIds.tolist()])
+    w.preset = preset
+    return w
+
+# Loads a level from resources/wireframes by name (e.g. "custom/giza"), from its .wire file if it has one that can
+# be read, otherwise from its .txt file. Returns None if it has neither.
+def loadWireframe(name):
+    try:
+        with open(resourcePath("wireframes/" + name + ".wire"), "rb") as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            return wireframeFromBytes(data)
+    except (OSError, ValueError):
+        pass
+    text = readFile("wireframes/" + name + ".txt")
+    if text is None: return None
+    return wireframeFromText(text)